@@ -0,0 +1,64 @@
+"""
+Compares production functions with declarative actions on a layered
+expression grammar, in which most productions pass on a value unchanged, and
+with the unit productions among those eliminated from the tables.
+
+    python benchmarks/bench_actions.py
+"""
+
+import time
+
+from rply import APPEND, LIST, PASS, ParserGenerator, Token
+
+LAYERS = ["expr", "term", "factor", "unary", "power", "atom"]
+
+
+def make_generator(declarative):
+    pg = ParserGenerator(["NUMBER", "COMMA", "LPAREN", "RPAREN"])
+
+    def rule(text, action):
+        if declarative:
+            pg.production(text, action=action)
+        else:
+            pg.production(text)(lambda p: action(p))
+
+    rule("main : exprs", PASS(0))
+    rule("exprs : expr", LIST)
+    rule("exprs : exprs COMMA expr", APPEND(0, 2))
+    for outer, inner in zip(LAYERS, LAYERS[1:]):
+        rule("%s : %s" % (outer, inner), PASS(0))
+    rule("atom : LPAREN expr RPAREN", PASS(1))
+    rule("atom : NUMBER", PASS(0))
+    return pg
+
+
+def make_tokens(count):
+    tokens = []
+    for i in range(count):
+        if i:
+            tokens.append(Token("COMMA", ","))
+        tokens += [Token("LPAREN", "("), Token("NUMBER", str(i)), Token("RPAREN", ")")]
+    return tokens
+
+
+def bench(parser, tokens, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parser.parse(iter(tokens))
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    tokens = make_tokens(20000)
+    functions = bench(make_generator(False).build(), tokens)
+    actions = bench(make_generator(True).build(), tokens)
+    units = bench(make_generator(True).build(eliminate_unit_productions=True), tokens)
+    print("production functions: %.3fs" % functions)
+    print("declarative actions:  %.3fs (%.2fx)" % (actions, functions / actions))
+    print("without unit chains:  %.3fs (%.2fx)" % (units, functions / units))
+
+
+if __name__ == "__main__":
+    main()
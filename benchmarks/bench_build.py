@@ -0,0 +1,59 @@
+"""
+Measures how the time to build the parser tables grows with the size of the
+grammar, on synthetic grammars with a statement rule per keyword and an
+expression grammar with an operator per precedence level.
+
+    python benchmarks/bench_build.py [productions ...]
+"""
+
+import sys
+import time
+
+from rply import ParserGenerator
+
+
+def make_generator(size):
+    # Roughly three productions per level and four per statement.
+    count = max(size // 7, 1)
+    keywords = ["KW%d" % i for i in range(count)]
+    operators = ["OP%d" % i for i in range(count)]
+    pg = ParserGenerator(
+        keywords + operators + ["NAME", "NUMBER", "SEMI", "LPAREN", "RPAREN"]
+    )
+
+    def rule(text):
+        pg.production(text)(lambda p: None)
+
+    rule("program : stmts")
+    rule("stmts : stmts stmt | stmt")
+    for i, keyword in enumerate(keywords):
+        rule("stmt : stmt%d" % i)
+        rule("stmt%d : %s expr0 SEMI" % (i, keyword))
+        rule("stmt%d : %s NAME stmt%d" % (i, keyword, i))
+        rule("stmt%d : %s LPAREN stmts RPAREN" % (i, keyword))
+    for i, operator in enumerate(operators):
+        rule("expr%d : expr%d %s expr%d | expr%d" % (i, i, operator, i + 1, i + 1))
+        rule("expr%d : %s expr%d" % (i, operator, i + 1))
+    rule("expr%d : NAME | NUMBER | LPAREN expr0 RPAREN" % count)
+    return pg
+
+
+def main(sizes):
+    print("%12s %8s %10s %10s" % ("productions", "states", "build", "slr"))
+    for size in sizes:
+        pg = make_generator(size)
+        start = time.perf_counter()
+        parser = pg.build()
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        make_generator(size).build(method="slr")
+        slr_elapsed = time.perf_counter() - start
+        states = len(parser.lr_table.lr_action)
+        print(
+            "%12d %8d %9.3fs %9.3fs"
+            % (len(pg.productions), states, elapsed, slr_elapsed)
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100, 200, 400, 800, 1600])
@@ -1,3 +1,4 @@
+from rply.actions import APPEND, LIST, NONE, PASS, TUPLE
 from rply.errors import LexingError, ParsingError
 from rply.lexergenerator import LexerGenerator
 from rply.parsergenerator import ParserGenerator
@@ -6,6 +7,11 @@ from rply.token import Token
 __version__ = "0.7.7"
 
 __all__ = [
+    "APPEND",
+    "LIST",
+    "NONE",
+    "PASS",
+    "TUPLE",
     "LexerGenerator",
     "LexingError",
     "ParserGenerator",
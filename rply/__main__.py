@@ -0,0 +1,233 @@
+"""
+Command line tools for rply::
+
+    python -m rply cache list
+    python -m rply cache prune [--max-size SIZE] [--max-age DAYS]
+    python -m rply cache clear
+    python -m rply build module:attr[=path] ... [--jobs N] [--code]
+    python -m rply report module:attr [--no-memory]
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import importlib
+import sys
+import time
+
+from rply.cache import CacheEntry, DirectoryCache
+from rply.parsergenerator import ParserGenerator
+from rply.report import BuildReport
+
+SIZE_UNITS = {"K": 2**10, "M": 2**20, "G": 2**30}
+
+
+def parse_size(text: str) -> int:
+    unit = SIZE_UNITS.get(text[-1:].upper())
+    if unit is None:
+        return int(text)
+    return int(float(text[:-1]) * unit)
+
+
+def format_size(size: float) -> str:
+    if size < 1024:
+        return "%dB" % size
+    for suffix in "KMG":
+        size /= 1024
+        if size < 1024 or suffix == "G":
+            break
+    return "%.1f%s" % (size, suffix)
+
+
+def print_entries(entries: list[CacheEntry]):
+    for entry in entries:
+        print(
+            "%8s  %s  %s"
+            % (
+                format_size(entry.size),
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.mtime)),
+                entry.key,
+            )
+        )
+
+
+def cache_command(args: argparse.Namespace):
+    backend = DirectoryCache(args.dir)
+    if args.action == "list":
+        entries = backend.entries()
+        print_entries(entries)
+        print(
+            "%d entries, %s in %s"
+            % (
+                len(entries),
+                format_size(sum(entry.size for entry in entries)),
+                backend.path,
+            )
+        )
+        return
+
+    if args.action == "prune":
+        removed = backend.prune(
+            max_size=args.max_size,
+            max_age=None if args.max_age is None else args.max_age * 24 * 60 * 60,
+            stale=not args.keep_stale,
+        )
+    else:
+        removed = backend.clear()
+    print_entries(removed)
+    print(
+        "Removed %d entries, %s"
+        % (len(removed), format_size(sum(entry.size for entry in removed)))
+    )
+
+
+def load_generator(spec: str) -> ParserGenerator:
+    """
+    Returns the :class:`~rply.ParserGenerator` named by `spec`, as
+    ``module:attr``.
+    """
+    module_name, sep, attr = spec.partition(":")
+    if not sep or not attr:
+        raise ValueError("Expected module:attr, got %r" % spec)
+    obj = importlib.import_module(module_name)
+    for name in attr.split("."):
+        obj = getattr(obj, name)
+    if not isinstance(obj, ParserGenerator):
+        raise TypeError("%s is not a ParserGenerator" % spec)
+    return obj
+
+
+def build_grammar(spec: str, code: bool = False) -> tuple[int, float]:
+    """
+    Builds the tables of the generator named by `spec`, as
+    ``module:attr[=path]``, and writes them to `path` if given, see
+    :meth:`rply.ParserGenerator.generate_module`.
+
+    Returns the number of states and the time taken to build.
+    """
+    spec, _, path = spec.partition("=")
+    pg = load_generator(spec)
+    start = time.perf_counter()
+    table = pg.build().lr_table
+    elapsed = time.perf_counter() - start
+    if path:
+        pg.write_module(table, path, code)
+    return len(table.lr_action), elapsed
+
+
+def build_command(args: argparse.Namespace) -> int:
+    failed = 0
+    print("%8s %10s  %s" % ("states", "build", "grammar"))
+    with concurrent.futures.ProcessPoolExecutor(args.jobs) as executor:
+        futures = {
+            spec: executor.submit(build_grammar, spec, args.code)
+            for spec in args.grammars
+        }
+        for spec, future in futures.items():
+            try:
+                states, elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                print("%8s %10s  %s: %s" % ("-", "failed", spec, e))
+            else:
+                print("%8d %9.3fs  %s" % (states, elapsed, spec))
+    return 1 if failed else 0
+
+
+def print_report(report: BuildReport):
+    print("%-16s %10s %12s" % ("phase", "time", "peak memory"))
+    for phase in report.phases:
+        print(
+            "%-16s %9.3fs %12s"
+            % (
+                phase.name,
+                phase.time,
+                "-" if phase.peak_memory is None else format_size(phase.peak_memory),
+            )
+        )
+    print("%-16s %9.3fs" % ("total", report.time))
+    print()
+    print("productions             %d" % report.productions)
+    print("states                  %d" % report.states)
+    print("items                   %d" % report.items)
+    print(
+        "transitions             %d terminal, %d nonterminal"
+        % (report.terminal_transitions, report.nonterminal_transitions)
+    )
+    print("action table density    %.1f%%" % (report.action_density * 100))
+    print("goto table density      %.1f%%" % (report.goto_density * 100))
+    print("shift/reduce conflicts  %d" % report.sr_conflicts)
+    print("reduce/reduce conflicts %d" % report.rr_conflicts)
+
+
+def report_command(args: argparse.Namespace):
+    print_report(load_generator(args.grammar).build_report(not args.no_memory))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m rply")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cache_parser = commands.add_parser(
+        "cache", help="inspect and prune the parser table cache"
+    )
+    cache_parser.add_argument("action", choices=["list", "prune", "clear"])
+    cache_parser.add_argument(
+        "--dir",
+        help="the cache directory, defaults to $RPLY_CACHE_DIR or the user cache",
+    )
+    cache_parser.add_argument(
+        "--max-size",
+        type=parse_size,
+        help="prune least recently used entries beyond this size, e.g. 50M",
+    )
+    cache_parser.add_argument(
+        "--max-age", type=float, help="prune entries unused for this many days"
+    )
+    cache_parser.add_argument(
+        "--keep-stale",
+        action="store_true",
+        help="keep entries superseded by a newer grammar with the same cache_id",
+    )
+    cache_parser.set_defaults(func=cache_command)
+
+    build_parser = commands.add_parser(
+        "build",
+        help="build the tables of parser generators, filling the cache",
+        description="Builds the tables of the ParserGenerator objects named "
+        "as module:attr, which fills their cache. With =path the tables are "
+        "also written to a module at path, see ParserGenerator.generate_module.",
+    )
+    build_parser.add_argument("grammars", nargs="+", metavar="module:attr[=path]")
+    build_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="the number of processes, defaults to the number of CPUs",
+    )
+    build_parser.add_argument(
+        "--code",
+        action="store_true",
+        help="include specialized parser code in written modules",
+    )
+    build_parser.set_defaults(func=build_command)
+
+    report_parser = commands.add_parser(
+        "report",
+        help="show where building the tables of a parser generator takes time",
+    )
+    report_parser.add_argument("grammar", metavar="module:attr")
+    report_parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="don't trace memory, which makes the times more accurate",
+    )
+    report_parser.set_defaults(func=report_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Declarative actions for trivial productions.
+
+A production registered with one of these actions instead of a function is
+reduced by the parser itself, without calling a function or building the
+list of matched values::
+
+    pg.production("expr : LPAREN expr RPAREN", action=PASS(1))
+    pg.production("args : arg", action=LIST)
+    pg.production("args : args COMMA arg", action=APPEND(0, 2))
+"""
+
+from __future__ import annotations
+
+from rply.errors import ParserGeneratorError
+
+# Action kinds, checked by the parser in this order.
+PASS_KIND = 0
+APPEND_KIND = 1
+TUPLE_KIND = 2
+LIST_KIND = 3
+NONE_KIND = 4
+
+
+class Action:
+    """
+    A reduction performed by the parser instead of a production function.
+
+    Actions can also be called like production functions, which is how they
+    behave when reduced.
+    """
+
+    __slots__ = ("kind", "a", "b")
+
+    def __init__(self, kind: int, a: int = 0, b: int = 0):
+        self.kind = kind
+        self.a = a
+        self.b = b
+
+    def __repr__(self):
+        if self.kind == PASS_KIND:
+            return f"PASS({self.a})"
+        elif self.kind == APPEND_KIND:
+            return f"APPEND({self.a}, {self.b})"
+        elif self.kind == TUPLE_KIND:
+            return "TUPLE"
+        elif self.kind == LIST_KIND:
+            return "LIST"
+        return "NONE"
+
+    def __eq__(self, other):
+        if not isinstance(other, Action):
+            return NotImplemented
+        return (self.kind, self.a, self.b) == (other.kind, other.a, other.b)
+
+    def __hash__(self):
+        return hash((self.kind, self.a, self.b))
+
+    def __call__(self, *args):
+        # Called as func(p) or func(state, p).
+        p = args[-1]
+        if self.kind == PASS_KIND:
+            return p[self.a]
+        elif self.kind == APPEND_KIND:
+            p[self.a].append(p[self.b])
+            return p[self.a]
+        elif self.kind == TUPLE_KIND:
+            return tuple(p)
+        elif self.kind == LIST_KIND:
+            return list(p)
+        return None
+
+    def check(self, length: int):
+        """
+        Raises :exc:`ParserGeneratorError` if the action refers to values
+        beyond the end of a production of the given length.
+        """
+        if self.kind == PASS_KIND:
+            indices = [self.a]
+        elif self.kind == APPEND_KIND:
+            indices = [self.a, self.b]
+        else:
+            return
+        for index in indices:
+            if not 0 <= index < length:
+                raise ParserGeneratorError(
+                    f"{self!r} doesn't fit a production of length {length}"
+                )
+
+
+def PASS(index: int) -> Action:
+    """
+    Returns the value at `index` of the matched values.
+    """
+    return Action(PASS_KIND, index)
+
+
+def APPEND(list_index: int, item_index: int) -> Action:
+    """
+    Appends the value at `item_index` to the list at `list_index` of the
+    matched values, in place, and returns that list.
+    """
+    return Action(APPEND_KIND, list_index, item_index)
+
+
+#: Returns the matched values as a tuple.
+TUPLE = Action(TUPLE_KIND)
+
+#: Returns the matched values as a list, to be extended with :func:`APPEND`.
+LIST = Action(LIST_KIND)
+
+#: Returns ``None``.
+NONE = Action(NONE_KIND)
@@ -0,0 +1,268 @@
+"""
+A compact representation of concrete syntax trees.
+
+Instead of calling a production function for every reduction, a parser can
+record the tree into a :class:`TreeArena`, see
+:meth:`rply.parser.LRParser.parse_tree`. Nodes are integers indexing a few
+flat arrays, in the order in which they were created. Children therefore
+always come before their parents and the root is the last node.
+"""
+
+from __future__ import annotations
+
+from array import array
+from typing import TYPE_CHECKING, Iterator
+
+from rply.token import Token
+
+if TYPE_CHECKING:
+    from rply.parsergenerator import LRTable
+
+# Node kinds other than production numbers.
+TOKEN = -1
+ERROR = -2
+
+
+class TreeArena:
+    """
+    A concrete syntax tree stored in flat arrays.
+
+    Each node has a kind (its production number, :data:`TOKEN` or
+    :data:`ERROR`), and covers the tokens ``tokens[start:end]``. The children
+    of a production node are ``children[child_start:child_start + n]``, where
+    `n` is the length of the production. For token and error nodes
+    `child_start` indexes :attr:`tokens` and :attr:`error_tokens`
+    respectively.
+
+    Use :attr:`root` and the :class:`Node` cursors it returns to walk the
+    tree.
+    """
+
+    def __init__(self, names: tuple[str, ...], lengths: tuple[int, ...]):
+        #: The name of each production, indexed by production number.
+        self.names = names
+        #: The length of each production, indexed by production number.
+        self.lengths = lengths
+        self.kinds = array("i")
+        self.starts = array("i")
+        self.ends = array("i")
+        self.child_starts = array("i")
+        self.children = array("i")
+        #: The tokens read by the parser.
+        self.tokens: list[Token] = []
+        #: The error tokens created when recovering from errors.
+        self.error_tokens: list[Token] = []
+        self.root_id = -1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, node_id: int) -> Node:
+        return Node(self, node_id)
+
+    @property
+    def root(self) -> Node:
+        return Node(self, self.root_id)
+
+    def add_node(self, kind: int, start: int, end: int, child_start: int) -> int:
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.child_starts.append(child_start)
+        return len(self.kinds) - 1
+
+    def child_ids(self, node_id: int) -> array:
+        kind = self.kinds[node_id]
+        if kind < 0:
+            return array("i")
+        start = self.child_starts[node_id]
+        return self.children[start : start + self.lengths[kind]]
+
+    def walk(self, node_id: int | None = None) -> Iterator[Node]:
+        """
+        Yields the nodes of the tree below `node_id`, or the root, in
+        pre-order.
+        """
+        stack = [self.root_id if node_id is None else node_id]
+        while stack:
+            current = stack.pop()
+            yield Node(self, current)
+            stack.extend(reversed(self.child_ids(current)))
+
+    def find_all(self, name: str) -> Iterator[Node]:
+        """
+        Yields the nodes of productions or tokens called `name`, in pre-order.
+        """
+        for node in self.walk():
+            if node.name == name:
+                yield node
+
+    def subtree(self, node_id: int) -> TreeArena:
+        """
+        Returns a new arena containing only the tree below `node_id`, and the
+        tokens it covers.
+        """
+        ids = sorted(node.id for node in self.walk(node_id))
+        new_ids = {old: new for new, old in enumerate(ids)}
+        offset = self.starts[node_id]
+
+        arena = TreeArena(self.names, self.lengths)
+        arena.tokens = self.tokens[offset : self.ends[node_id]]
+        for old in ids:
+            kind = self.kinds[old]
+            if kind == TOKEN:
+                child_start = self.child_starts[old] - offset
+            elif kind == ERROR:
+                arena.error_tokens.append(self.error_tokens[self.child_starts[old]])
+                child_start = len(arena.error_tokens) - 1
+            else:
+                child_start = len(arena.children)
+                arena.children.extend(new_ids[c] for c in self.child_ids(old))
+            arena.add_node(
+                kind, self.starts[old] - offset, self.ends[old] - offset, child_start
+            )
+        arena.root_id = new_ids[node_id]
+        return arena
+
+
+class Node:
+    """
+    A cursor pointing at one node of a :class:`TreeArena`.
+    """
+
+    __slots__ = ("arena", "id")
+
+    def __init__(self, arena: TreeArena, node_id: int):
+        self.arena = arena
+        self.id = node_id
+
+    def __repr__(self):
+        return f"Node({self.name}, {self.id})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self.arena is other.arena and self.id == other.id
+
+    def __hash__(self):
+        return hash((id(self.arena), self.id))
+
+    @property
+    def kind(self) -> int:
+        return self.arena.kinds[self.id]
+
+    @property
+    def is_token(self) -> bool:
+        return self.kind < 0
+
+    @property
+    def name(self) -> str:
+        kind = self.kind
+        if kind == TOKEN:
+            return self.arena.tokens[self.arena.child_starts[self.id]].name
+        elif kind == ERROR:
+            return "error"
+        return self.arena.names[kind]
+
+    @property
+    def token(self) -> Token | None:
+        kind = self.kind
+        if kind == TOKEN:
+            return self.arena.tokens[self.arena.child_starts[self.id]]
+        elif kind == ERROR:
+            return self.arena.error_tokens[self.arena.child_starts[self.id]]
+        return None
+
+    @property
+    def span(self) -> tuple[int, int]:
+        return self.arena.starts[self.id], self.arena.ends[self.id]
+
+    @property
+    def tokens(self) -> list[Token]:
+        return self.arena.tokens[self.arena.starts[self.id] : self.arena.ends[self.id]]
+
+    @property
+    def children(self) -> list[Node]:
+        return [Node(self.arena, c) for c in self.arena.child_ids(self.id)]
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __len__(self):
+        return len(self.arena.child_ids(self.id))
+
+    def __getitem__(self, i: int) -> Node:
+        return Node(self.arena, self.arena.child_ids(self.id)[i])
+
+
+class TreeBuilder:
+    """
+    Records the reductions of a parser into a :class:`TreeArena`.
+    """
+
+    def __init__(self, table: LRTable):
+        productions = table.grammar.productions
+        self.lr_goto = table.lr_goto
+        self.productions = productions
+        self.arena = TreeArena(
+            tuple(p.name for p in productions),
+            tuple(p.getlength() for p in productions),
+        )
+        self.token_ids: dict[int, int] = {}
+
+    def record(self, tokenizer) -> Iterator[Token]:
+        tokens = self.arena.tokens
+        token_ids = self.token_ids
+        for token in tokenizer:
+            token_ids[id(token)] = len(tokens)
+            tokens.append(token)
+            yield token
+
+    def reduce(self, t, symstack, statestack, state):
+        arena = self.arena
+        p = self.productions[-t]
+        plen = p.getlength()
+
+        child_start = len(arena.children)
+        if plen:
+            values = symstack[-plen:]
+            del symstack[-plen:]
+            del statestack[-plen:]
+        else:
+            values = []
+        # Empty productions and error tokens get empty spans after the
+        # preceding tokens.
+        position = self._stack_end(symstack)
+        start = position
+        for value in values:
+            if isinstance(value, Token):
+                index = self.token_ids.get(id(value))
+                if index is None:
+                    arena.error_tokens.append(value)
+                    value = arena.add_node(
+                        ERROR, position, position, len(arena.error_tokens) - 1
+                    )
+                else:
+                    value = arena.add_node(TOKEN, index, index + 1, index)
+            arena.children.append(value)
+            position = arena.ends[value]
+        if values:
+            start = arena.starts[arena.children[child_start]]
+
+        symstack.append(arena.add_node(p.number, start, position, child_start))
+        current_state = self.lr_goto[statestack[-1]][p.name]
+        statestack.append(current_state)
+        return current_state
+
+    def _stack_end(self, symstack) -> int:
+        for value in reversed(symstack):
+            if isinstance(value, int):
+                return self.arena.ends[value]
+            index = self.token_ids.get(id(value))
+            if index is not None:
+                return index + 1
+        return 0
+
+    def finish(self, root_id: int) -> TreeArena:
+        self.arena.root_id = root_id
+        return self.arena
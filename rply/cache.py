@@ -0,0 +1,432 @@
+"""
+Storage of parser tables in the cache.
+
+:meth:`rply.ParserGenerator.build` looks up the tables of a grammar with a
+`cache_id` in a list of :class:`CacheBackend` objects, by default a
+:class:`DirectoryCache`. On a miss the new tables are stored in all of them,
+on a hit in any backend before the one that had them.
+
+Tables are stored in one of these formats:
+
+``"binary"``
+    A header followed by the tables in :mod:`marshal` format. Loading
+    produces the dicts and lists of the table directly, reading from a
+    memory map of the file, with no conversion afterwards.
+``"compressed"``
+    The same, compressed with :mod:`zlib`. Smaller, but slower to load.
+``"json"``
+    Portable between Python versions and readable by other tools.
+
+Binary tables written by a Python version with a different :mod:`marshal`
+format are ignored, like tables that aren't in the cache at all.
+
+Layout of a binary table::
+
+    header      struct HEADER
+    tables      marshal data, possibly compressed
+"""
+
+from __future__ import annotations
+
+import contextlib
+import errno
+import importlib.resources
+import json
+import marshal
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any
+
+from appdirs import AppDirs
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MAGIC = b"RPLYCACH"
+FORMAT_VERSION = 1
+# magic, format version, marshal version, flags
+HEADER = struct.Struct("<8sHHI")
+COMPRESSED = 1
+
+FORMATS = ("binary", "compressed", "json")
+
+#: The environment variable overriding the default cache directory.
+CACHE_DIR_ENV = "RPLY_CACHE_DIR"
+
+
+def check_format(format: str):
+    if format not in FORMATS:
+        raise ValueError(
+            "Unknown cache format %r, expected one of %s" % (format, ", ".join(FORMATS))
+        )
+
+
+def dumps(data: dict[str, Any], format: str = "binary") -> bytes:
+    """
+    Returns the serialized tables `data` in the given format.
+    """
+    check_format(format)
+    if format == "json":
+        return json.dumps(data).encode()
+    body = marshal.dumps(data)
+    flags = 0
+    if format == "compressed":
+        body = zlib.compress(body)
+        flags |= COMPRESSED
+    return HEADER.pack(MAGIC, FORMAT_VERSION, marshal.version, flags) + body
+
+
+def loads(buffer) -> dict[str, Any] | None:
+    """
+    Returns the tables serialized in `buffer`, in any of the formats, or
+    ``None`` if they were written in an incompatible binary format.
+    """
+    with memoryview(buffer) as view:
+        if view[: len(MAGIC)] != MAGIC:
+            return json.loads(bytes(view))
+        _, version, marshal_version, flags = HEADER.unpack_from(view)
+        if version != FORMAT_VERSION or marshal_version != marshal.version:
+            return None
+        with view[HEADER.size :] as body:
+            if flags & COMPRESSED:
+                return marshal.loads(zlib.decompress(body))
+            return marshal.loads(body)
+
+
+def read(path: str) -> dict[str, Any] | None:
+    """
+    Reads tables written with :func:`dumps` from the file at `path`, see
+    :func:`loads`. Returns ``None`` if the file is damaged.
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return None
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _loads_or_none(buffer)
+    finally:
+        buffer.close()
+
+
+def _loads_or_none(buffer) -> dict[str, Any] | None:
+    try:
+        return loads(buffer)
+    except (ValueError, EOFError, struct.error, zlib.error):
+        return None
+
+
+def file_name(key: str, format: str) -> str:
+    return key + (".json" if format == "json" else ".tables")
+
+
+def split_key(key: str) -> tuple[str, str] | None:
+    """
+    Returns the `cache_id` in `key` and the key without the build variant,
+    which identifies the version of the grammar, or ``None`` if `key` isn't
+    a key written by :meth:`rply.ParserGenerator.build`.
+    """
+    parts = key.rsplit("-", 2)
+    if len(parts) != 3:
+        return None
+    cache_id, version, digest = parts
+    return cache_id, "%s-%s-%s" % (cache_id, version, digest.split(".", 1)[0])
+
+
+@dataclass
+class CacheEntry:
+    """
+    A file in a :class:`DirectoryCache`.
+    """
+
+    path: str
+    cache_id: str
+    key: str
+    #: The key without the build variant, shared by the tables built from
+    #: one version of the grammar.
+    grammar: str
+    #: The size in bytes.
+    size: int
+    #: The time the entry was last written or loaded.
+    mtime: float
+
+
+class CacheBackend:
+    """
+    A place to keep parser tables, identified by a key which changes with
+    the grammar they were built from.
+
+    The tables are passed around as dicts of plain lists and dicts, as
+    returned by :meth:`rply.ParserGenerator.serialize_table`. They may be
+    shared by several parsers and must not be modified.
+    """
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        """
+        Returns the tables stored under `key`, or ``None``.
+        """
+        raise NotImplementedError
+
+    def store(self, key: str, data: dict[str, Any]):
+        """
+        Stores the tables `data` under `key`, if the backend is writable.
+        """
+        raise NotImplementedError
+
+    def lock(self, key: str) -> contextlib.AbstractContextManager:
+        """
+        Returns a context manager held while the tables for `key` are built,
+        so that other processes wait for them instead of building them too.
+        By default nothing is locked.
+        """
+        return contextlib.nullcontext()
+
+
+class DirectoryCache(CacheBackend):
+    """
+    Keeps tables as files in the directory `path`. If `path` isn't given, the
+    directory named by the ``RPLY_CACHE_DIR`` environment variable is used,
+    or else the user's cache directory.
+
+    Storing tables removes the entries for older versions of the same
+    grammar, that is with the same `cache_id` and different declarations.
+    Tables built from the same declarations with another `method` or
+    `starts` are kept. If `max_size` is given, the
+    least recently used entries are removed as well, until the directory
+    holds at most `max_size` bytes of tables.
+
+    Processes building the same grammar at the same time wait for the one
+    that started first, for at most `lock_timeout` seconds, see :meth:`lock`.
+
+    Nothing is stored if the directory can't be created because the file
+    system is read-only.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        format: str = "binary",
+        max_size: int | None = None,
+        lock_timeout: float = 60.0,
+    ):
+        check_format(format)
+        if path is None:
+            path = os.environ.get(CACHE_DIR_ENV) or AppDirs("rply").user_cache_dir
+        self.path = path
+        self.format = format
+        self.max_size = max_size
+        self.lock_timeout = lock_timeout
+
+    def __repr__(self):
+        return "DirectoryCache(%r, format=%r)" % (self.path, self.format)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.path, file_name(key, self.format))
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        data = read(path)
+        if data is not None:
+            # Mark the entry as recently used, for eviction.
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return data
+
+    def store(self, key: str, data: dict[str, Any]):
+        if not self._makedirs():
+            return
+
+        with tempfile.NamedTemporaryFile(dir=self.path, delete=False) as f:
+            f.write(dumps(data, self.format))
+        os.rename(f.name, self.path_for(key))
+
+        cache_id, grammar = split_key(key)
+        for entry in self.entries():
+            if entry.cache_id == cache_id and entry.grammar != grammar:
+                self._remove(entry)
+        if self.max_size is not None:
+            self.prune(max_size=self.max_size)
+
+    @contextlib.contextmanager
+    def lock(self, key: str):
+        """
+        Holds an advisory lock on a file in the directory, shared by all
+        versions of the grammar. If the lock can't be acquired within
+        `lock_timeout` seconds, the tables are built without it.
+
+        Locking requires :mod:`fcntl`; elsewhere this does nothing.
+        """
+        if fcntl is None or not self._makedirs():
+            yield
+            return
+
+        path = os.path.join(self.path, key.rsplit("-", 2)[0] + ".lock")
+        try:
+            f = open(path, "a")
+        except OSError:
+            yield
+            return
+        with f:
+            deadline = time.monotonic() + self.lock_timeout
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        yield
+                        return
+                    time.sleep(0.05)
+                else:
+                    break
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _makedirs(self) -> bool:
+        if not os.path.exists(self.path):
+            try:
+                os.makedirs(self.path, mode=0o0700)
+            except OSError as e:
+                if e.errno == errno.EROFS:
+                    return False
+                raise
+        return True
+
+    def entries(self) -> list[CacheEntry]:
+        """
+        Returns the entries in the directory, least recently used first.
+        """
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            key, ext = os.path.splitext(name)
+            split = split_key(key)
+            if ext not in (".tables", ".json") or split is None:
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cache_id, grammar = split
+            entries.append(
+                CacheEntry(path, cache_id, key, grammar, st.st_size, st.st_mtime)
+            )
+        entries.sort(key=lambda entry: entry.mtime)
+        return entries
+
+    def prune(
+        self,
+        max_size: int | None = None,
+        max_age: float | None = None,
+        stale: bool = True,
+    ) -> list[CacheEntry]:
+        """
+        Removes entries from the directory and returns them:
+
+        - if `stale` is true, entries for which a more recent entry with the
+          same `cache_id` and another version of the grammar exists,
+        - entries that haven't been used for `max_age` seconds,
+        - the least recently used entries, until the remaining ones take at
+          most `max_size` bytes.
+        """
+        entries = self.entries()
+        cutoff = None if max_age is None else time.time() - max_age
+        latest = {entry.cache_id: entry.grammar for entry in entries}
+        kept = []
+        removed = []
+        for entry in entries:
+            if (stale and entry.grammar != latest[entry.cache_id]) or (
+                cutoff is not None and entry.mtime < cutoff
+            ):
+                removed.append(entry)
+            else:
+                kept.append(entry)
+        if max_size is not None:
+            size = sum(entry.size for entry in kept)
+            for entry in kept:
+                if size <= max_size:
+                    break
+                removed.append(entry)
+                size -= entry.size
+        for entry in removed:
+            self._remove(entry)
+        return removed
+
+    def clear(self) -> list[CacheEntry]:
+        """
+        Removes all entries and returns them.
+        """
+        entries = self.entries()
+        for entry in entries:
+            self._remove(entry)
+        return entries
+
+    def _remove(self, entry: CacheEntry):
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+class MemoryCache(CacheBackend):
+    """
+    Keeps tables in a dict for the lifetime of the process, see
+    :data:`memory`.
+    """
+
+    def __init__(self):
+        self.tables: dict[str, dict[str, Any]] = {}
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        return self.tables.get(key)
+
+    def store(self, key: str, data: dict[str, Any]):
+        self.tables[key] = data
+
+
+class BundledCache(CacheBackend):
+    """
+    Reads tables shipped as resources of the package `package`, for example
+    written there with a :class:`DirectoryCache` at build time. This backend
+    is read-only.
+    """
+
+    def __init__(self, package: str, format: str = "binary"):
+        check_format(format)
+        self.package = package
+        self.format = format
+
+    def __repr__(self):
+        return "BundledCache(%r, format=%r)" % (self.package, self.format)
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        resource = importlib.resources.files(self.package).joinpath(
+            file_name(key, self.format)
+        )
+        if not resource.is_file():
+            return None
+        return _loads_or_none(resource.read_bytes())
+
+    def store(self, key: str, data: dict[str, Any]):
+        pass
+
+
+#: A :class:`MemoryCache` that can be shared by all generators in a process::
+#:
+#:     ParserGenerator(tokens, cache_id="mylang", cache=[memory, DirectoryCache()])
+memory = MemoryCache()
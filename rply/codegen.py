@@ -0,0 +1,203 @@
+"""
+Generates Python source for a parser specialized to one set of tables.
+
+Instead of looking up every step in the action and goto tables, the generated
+``parse`` function switches on the current state with a tree of comparisons,
+branches on the token type with the state's actions written out inline, and
+reduces with the production length, function and goto target baked in.
+
+The generated code keeps an explicit state stack rather than using recursive
+ascent, so that deeply nested or right-recursive input cannot exhaust the
+Python recursion limit.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from rply.actions import APPEND_KIND, LIST_KIND, PASS_KIND, TUPLE_KIND
+
+if TYPE_CHECKING:
+    from rply.parsergenerator import LRTable
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: list[str] = []
+        self.level = 0
+
+    def line(self, text: str = ""):
+        self.lines.append("    " * self.level + text if text else "")
+
+    def indent(self):
+        self.level += 1
+
+    def dedent(self):
+        self.level -= 1
+
+
+class _ParserSource:
+    def __init__(self, table: LRTable):
+        self.table = table
+        self.productions = table.grammar.productions
+        self.constants: list[str] = []
+
+        self.gotos: dict[str, dict[int, int]] = {}
+        for state, gotos in enumerate(table.lr_goto):
+            for name, target in gotos.items():
+                self.gotos.setdefault(name, {})[state] = target
+        self.goto_names = {
+            name: "_goto_%d" % i for i, name in enumerate(sorted(self.gotos))
+        }
+        for name, var in sorted(self.goto_names.items(), key=lambda x: x[1]):
+            self.constants.append("%s = %r" % (var, self.gotos[name]))
+
+    def generate(self) -> str:
+        w = _Writer()
+        w.line("def bind(funcs, on_error):")
+        w.indent()
+        for p in self.productions[1:]:
+            # The start productions are accepted, never reduced.
+            if p.action is None and p.name != "S'":
+                w.line("f%d = funcs[%d]" % (p.number, p.number))
+        w.line()
+        w.line("def parse(tokenizer, state=None, lookahead=None):")
+        w.indent()
+        w.line('symstack = [Token("$end", "$end")]')
+        w.line("statestack = [0]")
+        w.line("ltype = None if lookahead is None else lookahead.name")
+        w.line("s = 0")
+        w.line("while True:")
+        w.indent()
+        self.write_states(w, 0, len(self.table.lr_action))
+        w.dedent()
+        w.dedent()
+        w.line()
+        w.line("return parse")
+
+        header = [
+            "from rply.token import Token",
+            "",
+        ]
+        return "\n".join(header + self.constants + ["", ""] + w.lines) + "\n"
+
+    def write_states(self, w: _Writer, lo: int, hi: int):
+        if hi - lo == 1:
+            self.write_state(w, lo)
+            return
+        mid = (lo + hi) // 2
+        w.line("if s < %d:" % mid)
+        w.indent()
+        self.write_states(w, lo, mid)
+        w.dedent()
+        w.line("else:")
+        w.indent()
+        self.write_states(w, mid, hi)
+        w.dedent()
+
+    def write_state(self, w: _Writer, state: int):
+        default = self.table.default_reductions[state]
+        if default:
+            self.write_reduce(w, -default)
+            return
+
+        w.line("if lookahead is None:")
+        w.indent()
+        w.line("lookahead = next(tokenizer, None)")
+        w.line("if lookahead is None:")
+        w.indent()
+        w.line('lookahead = Token("$end", "$end")')
+        w.dedent()
+        w.line("ltype = lookahead.name")
+        w.dedent()
+
+        groups: dict[int, list[str]] = {}
+        for ltype, action in self.table.lr_action[state].items():
+            groups.setdefault(action, []).append(ltype)
+
+        keyword = "if"
+        for i, (action, ltypes) in enumerate(sorted(groups.items())):
+            if len(ltypes) == 1:
+                w.line("%s ltype == %r:" % (keyword, ltypes[0]))
+            else:
+                var = "_lookaheads_%d_%d" % (state, i)
+                self.constants.append("%s = frozenset(%r)" % (var, sorted(ltypes)))
+                w.line("%s ltype in %s:" % (keyword, var))
+            keyword = "elif"
+            w.indent()
+            if action > 0:
+                w.line("statestack.append(%d)" % action)
+                w.line("symstack.append(lookahead)")
+                w.line("lookahead = None")
+                w.line("s = %d" % action)
+                w.line("continue")
+            elif action < 0:
+                self.write_reduce(w, -action)
+            else:
+                w.line("return symstack[-1]")
+            w.dedent()
+        w.line("return on_error(tokenizer, lookahead, statestack, symstack, state)")
+
+    def write_reduce(self, w: _Writer, number: int):
+        p = self.productions[number]
+        plen = p.getlength()
+        action = p.action
+        if action is None:
+            if plen:
+                w.line("args = symstack[-%d:]" % plen)
+                w.line("del symstack[-%d:]" % plen)
+                w.line("del statestack[-%d:]" % plen)
+            else:
+                w.line("args = []")
+            w.line("if state is None:")
+            w.indent()
+            w.line("symstack.append(f%d(args))" % number)
+            w.dedent()
+            w.line("else:")
+            w.indent()
+            w.line("symstack.append(f%d(state, args))" % number)
+            w.dedent()
+        elif action.kind == PASS_KIND and plen == 1:
+            # The value stays where it is.
+            w.line("statestack.pop()")
+        else:
+            if action.kind == PASS_KIND:
+                w.line("value = symstack[%d]" % (action.a - plen))
+            elif action.kind == APPEND_KIND:
+                w.line("value = symstack[%d]" % (action.a - plen))
+                w.line("value.append(symstack[%d])" % (action.b - plen))
+            elif action.kind == TUPLE_KIND:
+                w.line("value = tuple(symstack[-%d:])" % plen if plen else "value = ()")
+            elif action.kind == LIST_KIND:
+                w.line("value = symstack[-%d:]" % plen if plen else "value = []")
+            else:
+                w.line("value = None")
+            if plen:
+                w.line("del symstack[-%d:]" % plen)
+                w.line("del statestack[-%d:]" % plen)
+            w.line("symstack.append(value)")
+
+        targets = self.gotos[p.name]
+        if len(set(targets.values())) == 1:
+            w.line("s = %d" % next(iter(targets.values())))
+        else:
+            w.line("s = %s[statestack[-1]]" % self.goto_names[p.name])
+        w.line("statestack.append(s)")
+        w.line("continue")
+
+
+def generate_parser(table: LRTable) -> str:
+    """
+    Returns the source of a module defining ``bind(funcs, on_error)``, which
+    returns a ``parse(tokenizer, state=None, lookahead=None)`` function for
+    `table`. `lookahead` is the token to parse before those from `tokenizer`,
+    such as the token selecting a start symbol.
+
+    `funcs` are the production functions indexed by production number.
+    Productions with an :class:`~rply.actions.Action` are reduced inline, the
+    generated code doesn't use their entries in `funcs`.
+    `on_error` is called as ``on_error(tokenizer, lookahead, statestack,
+    symstack, state)`` when no action applies, and its return value is
+    returned from ``parse``.
+    """
+    return _ParserSource(table).generate()
@@ -2,8 +2,13 @@ from __future__ import annotations
 
 from typing import Callable, Literal
 
+from rply.actions import Action
 from rply.errors import ParserGeneratorError
-from rply.utils import iteritems
+from rply.utils import iteritems, itervalues
+
+#: The prefix of the names of the tokens selecting a start symbol other than
+#: the first, which the parser shifts before the first real token.
+START_PREFIX = "$start:"
 
 
 def rightmost_terminal(symbols: list[str], terminals: dict[str, list]):
@@ -31,6 +36,7 @@ class Grammar:
         self.follow = {}
         self.precedence: dict[str, tuple[str, int]] = {}
         self.start = None
+        self.starts: list[str] = []
 
     def add_production(
         self, prod_name: str, syms: list[str], func: Callable, precedence: str | None
@@ -50,6 +56,9 @@ class Grammar:
             except KeyError:
                 raise ParserGeneratorError(f"Precedence {precedence} doesn't exist")
 
+        if isinstance(func, Action):
+            func.check(len(syms))
+
         pnumber: int = len(self.productions)
         self.nonterminals.setdefault(prod_name, [])
 
@@ -75,15 +84,36 @@ class Grammar:
             )
         self.precedence[term] = (assoc, level)
 
-    def set_start(self):
+    def set_start(self, starts: list[str] | None = None):
+        """
+        Adds the augmented start productions. The start symbol is the first
+        of `starts`, or else the name of the first production.
+
+        The other names in `starts` can be parsed as well. For each of them a
+        production ``S' : $start:name name`` is added, so that the parser
+        starts with that name after shifting the token ``$start:name``.
+        """
         if len(self.productions) < 2:
             raise ParserGeneratorError("Grammar must contain at least one rule")
         if self.productions[1] is None:
             raise ParserGeneratorError("Grammar has no start symbol")
-        start = self.productions[1].name
+        starts = list(dict.fromkeys(starts or [self.productions[1].name]))
+        for name in starts:
+            if name not in self.prod_names:
+                raise ParserGeneratorError("Start symbol %s is not defined" % name)
+        start = starts[0]
         self.productions[0] = Production(0, "S'", [start], ("right", 0), None)
         self.nonterminals[start].append(0)
         self.start = start
+        self.starts = starts
+        for name in starts[1:]:
+            pnumber = len(self.productions)
+            token = START_PREFIX + name
+            self.terminals[token] = [pnumber]
+            self.nonterminals[name].append(pnumber)
+            self.productions.append(
+                Production(pnumber, "S'", [token, name], ("right", 0), None)
+            )
 
     def unused_terminals(self):
         return [
@@ -101,93 +131,113 @@ class Grammar:
         for production in self.productions:
             if production is None:
                 continue
-            lastlri = production
-            i = 0
-            lr_items: list[LRItem] = []
-            while True:
-                if i > len(production):
-                    lri = None
-                else:
-                    try:
-                        before = production.prod[i - 1]
-                    except IndexError:
-                        before = None
-                    try:
-                        after = self.prod_names[production.prod[i]]
-                    except (IndexError, KeyError):
-                        after = []
-                    lri = LRItem(production, i, before, after)
-
-                lastlri.lr_next = lri
-
-                if lri is None:
-                    break
-                lr_items.append(lri)
-                lastlri = lri
-                i += 1
-            production.lr_items = lr_items
+            production.lr_items = [
+                LRItem(production, i) for i in range(len(production) + 1)
+            ]
+            production.lr_next = production.lr_items[0]
 
     def _first(self, beta):
-        result = []
+        return sorted(self._first_set(beta))
+
+    def _first_set(self, beta):
+        result = set()
         for x in beta:
-            x_produces_empty = False
-            for f in self.first[x]:
-                if f == "<empty>":
-                    x_produces_empty = True
-                else:
-                    if f not in result:
-                        result.append(f)
-            if not x_produces_empty:
-                break
-        else:
-            result.append("<empty>")
+            fx = self.first[x]
+            result.update(fx)
+            if "<empty>" not in fx:
+                result.discard("<empty>")
+                return result
+        result.add("<empty>")
         return result
 
     def compute_first(self):
+        """
+        Computes the FIRST set of every symbol, the terminals a string derived
+        from it can start with, including ``"<empty>"`` if that string can be
+        empty. The sets are stored as sorted lists.
+        """
         for t in self.terminals:
-            self.first[t] = [t]
+            self.first[t] = {t}
 
-        self.first["$end"] = ["$end"]
+        self.first["$end"] = {"$end"}
 
         for n in self.nonterminals:
-            self.first[n] = []
-
-        changed = True
-        while changed:
-            changed = False
-            for n in self.nonterminals:
-                for p in self.prod_names[n]:
-                    for f in self._first(p.prod):
-                        if f not in self.first[n]:
-                            self.first[n].append(f)
-                            changed = True
+            self.first[n] = set()
+
+        # Productions to revisit when the FIRST set of a symbol grows.
+        users: dict[str, list[Production]] = {}
+        work = []
+        for n in self.nonterminals:
+            for p in self.prod_names[n]:
+                work.append(p)
+                for x in p.unique_syms:
+                    users.setdefault(x, []).append(p)
+        queued = set(work)
+
+        while work:
+            p = work.pop()
+            queued.discard(p)
+            first = self.first[p.name]
+            size = len(first)
+            first.update(self._first_set(p.prod))
+            if len(first) != size:
+                for user in users.get(p.name, []):
+                    if user not in queued:
+                        queued.add(user)
+                        work.append(user)
+
+        for x, first in iteritems(self.first):
+            self.first[x] = sorted(first)
 
     def compute_follow(self):
+        """
+        Computes the FOLLOW set of every nonterminal, the terminals that can
+        come after it. The sets are stored as sorted lists.
+        """
+        follow: dict[str, set[str]] = {}
         for k in self.nonterminals:
-            self.follow[k] = []
-
-        start = self.start
-        self.follow[start] = ["$end"]
-
-        added = True
-        while added:
-            added = False
-            for p in self.productions[1:]:
-                for i, B in enumerate(p.prod):
-                    if B in self.nonterminals:
-                        fst = self._first(p.prod[i + 1 :])
-                        has_empty = False
-                        for f in fst:
-                            if f != "<empty>" and f not in self.follow[B]:
-                                self.follow[B].append(f)
-                                added = True
-                            if f == "<empty>":
-                                has_empty = True
-                        if has_empty or i == (len(p.prod) - 1):
-                            for f in self.follow[p.name]:
-                                if f not in self.follow[B]:
-                                    self.follow[B].append(f)
-                                    added = True
+            follow[k] = set()
+
+        for start in self.starts:
+            follow[start].add("$end")
+
+        # FOLLOW(A) is part of FOLLOW(B) for every B in includes[A].
+        includes: dict[str, set[str]] = {}
+        for p in self.productions[1:]:
+            if p.name == "S'":
+                continue
+            suffix = {"<empty>"}
+            for B in reversed(p.prod):
+                if B in self.nonterminals:
+                    follow[B].update(suffix)
+                    if "<empty>" in suffix:
+                        includes.setdefault(p.name, set()).add(B)
+                first = self.first[B]
+                if "<empty>" not in first:
+                    suffix = set(first)
+                elif "<empty>" in suffix:
+                    suffix = suffix.union(first)
+                else:
+                    # B can be empty but the rest of the production can't.
+                    suffix = suffix.union(first)
+                    suffix.discard("<empty>")
+        for f in itervalues(follow):
+            f.discard("<empty>")
+
+        work = list(includes)
+        queued = set(work)
+        while work:
+            A = work.pop()
+            queued.discard(A)
+            for B in includes[A]:
+                size = len(follow[B])
+                follow[B].update(follow[A])
+                if len(follow[B]) != size and B in includes and B not in queued:
+                    queued.add(B)
+                    work.append(B)
+
+        for k, f in iteritems(follow):
+            self.follow[k] = sorted(f)
 
 
 class Production:
@@ -203,11 +253,11 @@ class Production:
         self.prod = prod
         self.number = num
         self.func = func
+        self.action = func if isinstance(func, Action) else None
         self.prec = precedence
         self.unique_syms = list(set(prod))
         self.lr_items: list[LRItem] = []
         self.lr_next: LRItem | None = None
-        self.lr0_added = 0
         self.reduced = 0
 
     def __repr__(self):
@@ -225,23 +275,67 @@ class Production:
 
 
 class LRItem:
-    def __init__(self, p: Production, n: int, before, after):
-        self.name = p.name
-        self.prod = p.prod[:]
-        self.prod.insert(n, ".")
-        self.number = p.number
+    """
+    A position in a production, before the symbol at `lr_index`.
+    """
+
+    __slots__ = ("production", "lr_index")
+
+    def __init__(self, p: Production, n: int):
+        self.production = p
         self.lr_index = n
-        self.lookaheads = {}
-        self.unique_syms = p.unique_syms
-        self.lr_before = before
-        self.lr_after = after
+
+    @property
+    def name(self) -> str:
+        return self.production.name
+
+    @property
+    def number(self) -> int:
+        return self.production.number
+
+    @property
+    def prod(self) -> list[str]:
+        prod = self.production.prod[:]
+        prod.insert(self.lr_index, ".")
+        return prod
 
     def __repr__(self):
         prods = " ".join(self.prod)
         return f"LRItem({self.name} -> {prods})"
 
+
+class RuntimeProduction:
+    """
+    The parts of a :class:`Production` that an :class:`~rply.parser.LRParser`
+    needs while parsing.
+    """
+
+    __slots__ = ("name", "number", "prod", "func", "action")
+
+    def __init__(self, num: int, name: str, prod: list[str], func: Callable | None):
+        self.name = name
+        self.number = num
+        self.prod = prod
+        self.func = func
+        self.action = func if isinstance(func, Action) else None
+
+    def __repr__(self):
+        prods = " ".join(self.prod)
+        return f"RuntimeProduction({self.name} -> {prods})"
+
     def getlength(self):
         return len(self.prod)
 
     def __len__(self):
         return len(self.prod)
+
+
+class RuntimeGrammar:
+    """
+    A stand-in for :class:`Grammar` on tables that were not built in this
+    process, holding only the productions needed to run reductions.
+    """
+
+    def __init__(self, start: str | None, productions: list[RuntimeProduction]):
+        self.start = start
+        self.productions = productions
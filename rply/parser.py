@@ -1,34 +1,147 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import os
+import threading
+import weakref
+from dataclasses import dataclass, field
 from typing import TYPE_CHECKING, Callable, Iterator
 
+from rply.actions import APPEND_KIND, LIST_KIND, PASS_KIND, TUPLE_KIND
 from rply.errors import ParsingError
+from rply.grammar import START_PREFIX
+
+# The number of tokens that have to be shifted after recovering from an error,
+# before the next error is reported.
+ERROR_RECOVERY_SHIFTS = 3
 
 if TYPE_CHECKING:
+    from multiprocessing.shared_memory import SharedMemory
+
+    from rply.arena import TreeArena
     from rply.lexer import LexerStream
     from rply.parsergenerator import LRTable
+    from rply.sharedtable import SharedLRTable
 
 
 @dataclass
 class LRParser:
-    lr_table: LRTable
+    lr_table: LRTable | SharedLRTable
     error_handler: Callable | None = None
 
-    def parse(self, tokenizer: LexerStream | Iterator, state=None):
+    def share(self, name: str | None = None) -> SharedMemory:
+        """
+        Moves the parser tables into a new block of shared memory, which this
+        parser reads them from from now on, and returns the block.
+
+        Processes forked afterwards parse against the same pages. Other
+        processes can attach to the block by its name using
+        :meth:`rply.ParserGenerator.attach_table`. The caller is responsible
+        for unlinking the block once it is no longer needed.
+        """
+        from rply.sharedtable import SharedLRTable, export_shared_memory
+
+        shm = export_shared_memory(self.lr_table, name)
+        funcs = [p.func for p in self.lr_table.grammar.productions]
+        self.lr_table = SharedLRTable(shm.buf, funcs, keepalive=shm)
+        return shm
+
+    def parse(
+        self, tokenizer: LexerStream | Iterator, state=None, start: str | None = None
+    ):
+        """
+        Parses the tokens and returns the value of the start symbol.
+
+        `start` selects one of the start symbols the tables were built for,
+        see :meth:`rply.ParserGenerator.build`.
+        """
         from rply.token import Token
 
-        lookahead = None
-        lookaheadstack = []
+        return self._parse(
+            tokenizer, state, self._start_token(start), [0], [Token("$end", "$end")]
+        )
 
-        statestack = [0]
-        symstack = [Token("$end", "$end")]
+    def validate(
+        self, tokenizer: LexerStream | Iterator, start: str | None = None
+    ) -> ParsingError | None:
+        """
+        Checks whether the tokens form a valid sentence of the grammar,
+        without calling any production functions or the error handler.
+
+        Returns ``None`` if they do, otherwise a :exc:`rply.ParsingError` for
+        the first token that could not be parsed, which is returned rather
+        than raised.
+        """
+        lr_action = self.lr_table.lr_action
+        lr_goto = self.lr_table.lr_goto
+        default_reductions = self.lr_table.default_reductions
+        productions = self.lr_table.grammar.productions
 
+        statestack = [0]
         current_state = 0
+        lookahead = self._start_token(start)
+        ltype = None if lookahead is None else lookahead.name
+        while True:
+            t = default_reductions[current_state]
+            if not t:
+                if ltype is None:
+                    lookahead = next(tokenizer, None)
+                    ltype = "$end" if lookahead is None else lookahead.name
+                actions = lr_action[current_state]
+                if ltype not in actions:
+                    position = None if lookahead is None else lookahead.position
+                    return ParsingError("", position)
+                t = actions[ltype]
+                if t > 0:
+                    statestack.append(t)
+                    current_state = t
+                    ltype = None
+                    continue
+                elif t == 0:
+                    return None
+
+            p = productions[-t]
+            plen = p.getlength()
+            if plen:
+                del statestack[-plen:]
+            current_state = lr_goto[statestack[-1]][p.name]
+            statestack.append(current_state)
+
+    def parse_tree(
+        self, tokenizer: LexerStream | Iterator, state=None, start: str | None = None
+    ) -> TreeArena:
+        """
+        Parses the tokens into a :class:`~rply.arena.TreeArena` recording the
+        concrete syntax tree, instead of calling the production functions.
+
+        `state` is only passed on to the error handler.
+        """
+        from rply.arena import TreeBuilder
+        from rply.token import Token
+
+        builder = TreeBuilder(self.lr_table)
+        root = self._parse(
+            builder.record(tokenizer),
+            state,
+            self._start_token(start),
+            [0],
+            [Token("$end", "$end")],
+            builder.reduce,
+        )
+        return builder.finish(root)
+
+    def _parse(self, tokenizer, state, lookahead, statestack, symstack, reduce=None):
+        from rply.token import Token
+
+        if reduce is None:
+            reduce = self._reduce_production
+        lookaheadstack = []
+        errorcount = 0
+
+        current_state = statestack[-1]
         while True:
             if self.lr_table.default_reductions[current_state]:
                 t = self.lr_table.default_reductions[current_state]
-                current_state = self._reduce_production(t, symstack, statestack, state)
+                current_state = reduce(t, symstack, statestack, state)
                 continue
 
             if lookahead is None:
@@ -43,7 +156,7 @@ class LRParser:
                 if lookahead is None:
                     lookahead = Token("$end", "$end")
 
-            ltype = lookahead.get_name()
+            ltype = lookahead.name
             if ltype in self.lr_table.lr_action[current_state]:
                 t = self.lr_table.lr_action[current_state][ltype]
                 if t > 0:
@@ -51,43 +164,228 @@ class LRParser:
                     current_state = t
                     symstack.append(lookahead)
                     lookahead = None
+                    if errorcount and ltype != "error":
+                        errorcount -= 1
                     continue
                 elif t < 0:
-                    current_state = self._reduce_production(
-                        t, symstack, statestack, state
-                    )
+                    current_state = reduce(t, symstack, statestack, state)
                     continue
                 else:
                     n = symstack[-1]
                     return n
             else:
-                # TODO: actual error handling here
-                if self.error_handler is not None:
-                    if state is None:
-                        self.error_handler(lookahead)
-                    else:
-                        self.error_handler(state, lookahead)
-                    raise AssertionError("For now, error_handler must raise.")
+                if errorcount == 0:
+                    self._handle_error(lookahead, state)
+                if ltype == "$end" or not self.lr_table.has_error_rules:
+                    raise ParsingError("", lookahead.position)
+
+                if ltype != "error":
+                    if errorcount == ERROR_RECOVERY_SHIFTS:
+                        # No token has been shifted since the last error, so
+                        # we are still out of sync, skip the offending token.
+                        lookahead = None
+                        continue
+                    errorcount = ERROR_RECOVERY_SHIFTS
+                    # Replace the offending token with an error token and try
+                    # again with it once the error token has been shifted.
+                    lookaheadstack.append(lookahead)
+                    lookahead = Token("error", lookahead.value, lookahead.position)
                 else:
-                    raise ParsingError("", lookahead.get_position())
+                    # The current state can't shift the error token, unwind
+                    # until one can, but not past the start token.
+                    top = symstack[-1]
+                    if len(statestack) <= 1 or (
+                        isinstance(top, Token) and top.name.startswith(START_PREFIX)
+                    ):
+                        raise ParsingError("", lookahead.position)
+                    statestack.pop()
+                    symstack.pop()
+                    current_state = statestack[-1]
+
+    def _start_token(self, start: str | None):
+        """
+        Returns the token the parser shifts first to parse the start symbol
+        `start`, or ``None`` for the default one.
+        """
+        from rply.token import Token
+
+        if start is None or start == self.lr_table.grammar.start:
+            return None
+        name = START_PREFIX + start
+        if name not in self.lr_table.lr_action[0]:
+            raise ValueError("%r is not a start symbol of the grammar" % start)
+        return Token(name, name)
+
+    def _handle_error(self, lookahead, state):
+        if self.error_handler is not None:
+            if state is None:
+                self.error_handler(lookahead)
+            else:
+                self.error_handler(state, lookahead)
+        else:
+            raise ParsingError("", lookahead.position)
 
     def _reduce_production(self, t, symstack, statestack, state):
         # reduce a symbol on the stack and emit a production
         p = self.lr_table.grammar.productions[-t]
         pname = p.name
         plen = p.getlength()
-        start = len(symstack) + (-plen - 1)
-        assert start >= 0
-        targ = symstack[start + 1 :]
         start = len(symstack) + (-plen)
-        assert start >= 0
+        assert start >= 1
+        action = p.action
+        if action is None:
+            targ = symstack[start:]
+            if state is None:
+                value = p.func(targ)
+            else:
+                value = p.func(state, targ)
+        elif action.kind == PASS_KIND:
+            value = symstack[start + action.a]
+        elif action.kind == APPEND_KIND:
+            value = symstack[start + action.a]
+            value.append(symstack[start + action.b])
+        elif action.kind == TUPLE_KIND:
+            value = tuple(symstack[start:])
+        elif action.kind == LIST_KIND:
+            value = symstack[start:]
+        else:
+            value = None
         del symstack[start:]
         del statestack[start:]
-        if state is None:
-            value = p.func(targ)
-        else:
-            value = p.func(state, targ)
         symstack.append(value)
         current_state = self.lr_table.lr_goto[statestack[-1]][pname]
         statestack.append(current_state)
         return current_state
+
+
+@dataclass
+class GeneratedLRParser(LRParser):
+    """
+    An :class:`LRParser` whose :meth:`parse` runs code generated for its
+    tables by :func:`rply.codegen.generate_parser`, instead of interpreting
+    the tables.
+
+    :param bind: The ``bind`` function defined by the generated code.
+    """
+
+    bind: Callable = field(kw_only=True)
+
+    def __post_init__(self):
+        funcs = [p.func for p in self.lr_table.grammar.productions]
+        self._generated_parse = self.bind(funcs, self._on_error)
+
+    def parse(
+        self, tokenizer: LexerStream | Iterator, state=None, start: str | None = None
+    ):
+        start_token = self._start_token(start)
+        if start_token is None:
+            return self._generated_parse(tokenizer, state)
+        return self._generated_parse(tokenizer, state, start_token)
+
+    def _on_error(self, tokenizer, lookahead, statestack, symstack, state):
+        # Continue with the table driven parser, which handles the error and
+        # recovers from it if the grammar allows.
+        return self._parse(tokenizer, state, lookahead, statestack, symstack)
+
+
+class LazyLRParser(LRParser):
+    """
+    An :class:`LRParser` whose tables are built by `build_table` when they are
+    first needed, as returned by :meth:`rply.ParserGenerator.build` with
+    `lazy`.
+
+    If `background` is true, the tables are built on a background thread
+    right away. Parsing before the thread is done waits for it.
+
+    The process may fork while the tables are being built. The child, which
+    doesn't have the thread building them, builds them again when its parser
+    is first used.
+    """
+
+    def __init__(
+        self,
+        build_table: Callable[[], LRTable],
+        error_handler: Callable | None = None,
+        background: bool = True,
+    ):
+        self._build_table = build_table
+        self._error_handler = error_handler
+        self._parser: LRParser | None = None
+        self._lock = threading.Lock()
+        _unbuilt[id(self)] = self
+        if background:
+            threading.Thread(target=self._build_in_background, daemon=True).start()
+
+    def __repr__(self):
+        return "LazyLRParser(built=%r)" % self.built
+
+    @property
+    def built(self) -> bool:
+        """
+        Whether the tables have been built.
+        """
+        return self._parser is not None
+
+    @property
+    def lr_table(self) -> LRTable | SharedLRTable:
+        return self._get_parser().lr_table
+
+    @property
+    def error_handler(self) -> Callable | None:
+        return self._error_handler
+
+    @error_handler.setter
+    def error_handler(self, handler: Callable | None):
+        self._error_handler = handler
+        if self._parser is not None:
+            self._parser.error_handler = handler
+
+    def share(self, name: str | None = None) -> SharedMemory:
+        return self._get_parser().share(name)
+
+    def parse(
+        self, tokenizer: LexerStream | Iterator, state=None, start: str | None = None
+    ):
+        return self._get_parser().parse(tokenizer, state, start)
+
+    def validate(
+        self, tokenizer: LexerStream | Iterator, start: str | None = None
+    ) -> ParsingError | None:
+        return self._get_parser().validate(tokenizer, start)
+
+    def parse_tree(
+        self, tokenizer: LexerStream | Iterator, state=None, start: str | None = None
+    ) -> TreeArena:
+        return self._get_parser().parse_tree(tokenizer, state, start)
+
+    def _get_parser(self) -> LRParser:
+        parser = self._parser
+        if parser is None:
+            with self._lock:
+                if self._parser is None:
+                    self._parser = LRParser(self._build_table(), self._error_handler)
+                    _unbuilt.pop(id(self), None)
+                parser = self._parser
+        return parser
+
+    def _build_in_background(self):
+        try:
+            self._get_parser()
+        except Exception:
+            # Raised again when the parser is used, building on that thread.
+            pass
+
+
+# The lazy parsers whose tables haven't been built yet, by id. A thread of the
+# parent process may be building them, holding their lock, when the process
+# forks.
+_unbuilt: weakref.WeakValueDictionary[int, LazyLRParser] = weakref.WeakValueDictionary()
+
+
+def _after_fork_in_child():
+    for parser in list(_unbuilt.values()):
+        parser._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -1,21 +1,29 @@
-import errno
+import contextlib
 import hashlib
+import importlib
 import json
-import os
+import re
 import sys
-import tempfile
+import tracemalloc
+import types
 import warnings
 from typing import Any, Callable, Literal
 
-from appdirs import AppDirs
-
+from rply.actions import APPEND, LIST, NONE, PASS, Action
+from rply.cache import CacheBackend, DirectoryCache
+from rply.codegen import generate_parser
 from rply.errors import ParserGeneratorError, ParserGeneratorWarning
-from rply.grammar import Grammar
-from rply.parser import LRParser
-from rply.utils import Counter, IdentityDict, iteritems, itervalues
+from rply.grammar import START_PREFIX, Grammar, RuntimeGrammar, RuntimeProduction
+from rply.parser import GeneratedLRParser, LazyLRParser, LRParser
+from rply.report import BuildReport
+from rply.sharedtable import SharedLRTable, attach_shared_memory, map_table
+from rply.utils import iteritems, itervalues
 
 LARGE_VALUE = sys.maxsize
 
+SEP_BY = re.compile(r"(sep_by1?)\(\s*([^\s,()|]+)\s*,\s*([^\s,()|]+)\s*\)")
+RULE_SYMBOL = re.compile(r"sep_by1?\([^()|]*\)|\||[^\s|]+")
+
 
 class ParserGenerator(object):
     """
@@ -30,6 +38,13 @@ class ParserGenerator(object):
                        token names with the same associativity and level of
                        precedence.
     :param cache_id: A string specifying an ID for caching.
+    :param cache_format: The format in which tables are cached, ``"binary"``,
+                         ``"compressed"`` or ``"json"``, see
+                         :mod:`rply.cache`.
+    :param cache: The :class:`~rply.cache.CacheBackend`, or a list of them,
+                  in which tables are cached if `cache_id` is given. Defaults
+                  to a :class:`~rply.cache.DirectoryCache` using
+                  `cache_format`.
     """
 
     VERSION = 1
@@ -39,14 +54,21 @@ class ParserGenerator(object):
         tokens: list[str],
         precedence: list[tuple[Literal["left", "right", "nonassoc"], list[str]]] = [],
         cache_id: str | None = None,
+        cache_format: Literal["binary", "compressed", "json"] = "binary",
+        cache: CacheBackend | list[CacheBackend] | None = None,
     ):
+        if cache is None:
+            cache = DirectoryCache(format=cache_format)
         self.tokens = tokens
         self.productions: list[tuple[str, list[str], Callable, Any]] = []
         self.precedence = precedence
         self.cache_id = cache_id
+        self.cache_backends = cache if isinstance(cache, list) else [cache]
         self.error_handler: Callable | None = None
+        # Nonterminals whose productions were generated for EBNF macros.
+        self._macros: set[str] = set()
 
-    def production(self, rule: str, precedence=None):
+    def production(self, rule: str, precedence=None, action: Action | None = None):
         """
         A decorator that defines one or many production rules and registers
         the decorated function to be called with the terminals and
@@ -76,6 +98,25 @@ class ParserGenerator(object):
 
         If a state was passed to the parser, the decorated function is
         additionally called with that state as first argument.
+
+        Symbols can be repeated using the following shorthands, which produce
+        a list or, in the case of ``?``, the value or ``None``::
+
+            item*                   zero or more items
+            item+                   one or more items
+            item?                   an optional item
+            sep_by(item, COMMA)     zero or more items, separated by COMMA
+            sep_by1(item, COMMA)    one or more items, separated by COMMA
+
+        The lists are built in place, so long repetitions take linear time.
+
+        Productions that merely pass on or collect the matched values can use
+        one of the actions in :mod:`rply.actions` instead of a function. The
+        parser performs those itself, which is considerably faster than
+        calling a function. In that case the rules are registered right away
+        and nothing needs to be decorated::
+
+            pg.production('expr : LPAREN expr RPAREN', action=PASS(1))
         """
         parts = rule.split()
         production_name = parts[0]
@@ -83,43 +124,120 @@ class ParserGenerator(object):
             raise ParserGeneratorError("Expecting :")
 
         body = " ".join(parts[2:])
-        prods = body.split("|")
+        prods: list[list[str]] = [[]]
+        macros: list[tuple[str, list[str], Action]] = []
+        for sym in RULE_SYMBOL.findall(body):
+            if sym == "|":
+                prods.append([])
+            else:
+                prods[-1].append(self._expand_macro(sym, macros))
 
         def inner(func: Callable):
-            for production in prods:
-                syms = production.split()
+            for syms in prods:
                 self.productions.append((production_name, syms, func, precedence))
+            defined = set(self._macros)
+            added = set()
+            for name, syms, macro_action in macros:
+                if name not in defined and (name, tuple(syms)) not in added:
+                    self.productions.append((name, syms, macro_action, None))
+                    added.add((name, tuple(syms)))
+            self._macros.update(name for name, _ in added)
             return func
 
+        if action is not None:
+            inner(action)
+            return None
         return inner
 
+    def _expand_macro(self, sym: str, macros: list) -> str:
+        # Returns the nonterminal standing in for `sym` and adds the
+        # productions defining it to `macros`.
+        match = SEP_BY.fullmatch(sym)
+        if match is not None:
+            macro, item, sep = match.groups()
+            item = self._expand_macro(item, macros)
+            sep = self._expand_macro(sep, macros)
+            name = "sep_by1(%s,%s)" % (item, sep)
+            macros.append((name, [item], LIST))
+            macros.append((name, [name, sep, item], APPEND(0, 2)))
+            if macro == "sep_by1":
+                return name
+            nonempty, name = name, "sep_by(%s,%s)" % (item, sep)
+            macros.append((name, [], LIST))
+            macros.append((name, [nonempty], PASS(0)))
+            return name
+        elif sym.startswith(("sep_by(", "sep_by1(")):
+            raise ParserGeneratorError("Expecting sep_by(item, separator): %s" % sym)
+
+        if len(sym) < 2 or sym[-1] not in "*+?":
+            return sym
+        item = self._expand_macro(sym[:-1], macros)
+        name = item + sym[-1]
+        if sym[-1] == "*":
+            macros.append((name, [], LIST))
+            macros.append((name, [name, item], APPEND(0, 1)))
+        elif sym[-1] == "+":
+            macros.append((name, [item], LIST))
+            macros.append((name, [name, item], APPEND(0, 1)))
+        else:
+            macros.append((name, [], NONE))
+            macros.append((name, [item], PASS(0)))
+        return name
+
     def error(self, func: Callable):
         """
         Sets the error handler that is called with the state (if passed to the
         parser) and the token the parser errored on.
 
-        Currently error handlers must raise an exception. If an error handler
-        is not defined, a :exc:`rply.ParsingError` will be raised.
+        If the error handler returns and the grammar has productions using the
+        special ``error`` terminal, the parser recovers from the error: it
+        discards states until one can shift an ``error`` token and then skips
+        tokens until parsing can continue. Further errors are reported once
+        three tokens have been shifted after the last one. If the parser can't
+        recover, a :exc:`rply.ParsingError` is raised.
+
+        If an error handler is not defined, a :exc:`rply.ParsingError` will be
+        raised on the first error.
         """
         self.error_handler = func
         return func
 
-    def compute_grammar_hash(self, g: Grammar):
+    def compute_grammar_hash(
+        self, method: str | Grammar = "lalr", starts: list[str] | None = None
+    ):
+        """
+        Returns a hash of the declarations the tables are built from, which
+        identifies the tables in the cache without analyzing the grammar.
+
+        If the tables are built with a `method` or `starts` other than the
+        defaults, they are appended after a ``.``, so that the cache can tell
+        the variants of one grammar apart from its older versions.
+
+        .. deprecated:: 0.7.7
+           Passing a :class:`~rply.grammar.Grammar` is still accepted, but
+           the grammar is ignored, the hash only depends on the declarations.
+        """
+        if isinstance(method, Grammar):
+            warnings.warn(
+                "compute_grammar_hash() no longer takes a grammar",
+                DeprecationWarning,
+                stacklevel=2,
+            )
+            method = "lalr"
         hasher = hashlib.sha1()
-        if g.start is None:
-            raise ValueError("Grammar has no start symbol")
-        hasher.update(g.start.encode())
-        hasher.update(json.dumps(sorted(g.terminals)).encode())
-        for term, (assoc, level) in sorted(iteritems(g.precedence)):
-            hasher.update(term.encode())
-            hasher.update(assoc.encode())
-            hasher.update(bytes(level))
-        for p in g.productions:
-            if p is None:
-                continue
-            hasher.update(p.name.encode())
-            hasher.update(json.dumps(p.prec).encode())
-            hasher.update(json.dumps(p.prod).encode())
+        hasher.update(json.dumps(sorted(self.tokens)).encode())
+        hasher.update(json.dumps(self._precedence_declarations()).encode())
+        for prod_name, syms, _, precedence in self.productions:
+            hasher.update(json.dumps([prod_name, syms, precedence]).encode())
+
+        variant = []
+        if method != "lalr":
+            variant.append(method)
+        starts = list(dict.fromkeys(starts or []))
+        if starts and starts != [self.productions[0][0]]:
+            variant.append(hashlib.sha1(json.dumps(starts).encode()).hexdigest()[:12])
+        if variant:
+            return "%s.%s" % (hasher.hexdigest(), "_".join(variant))
         return hasher.hexdigest()
 
     def serialize_table(self, table: "LRTable"):
@@ -129,38 +247,149 @@ class ParserGenerator(object):
             "sr_conflicts": table.sr_conflicts,
             "rr_conflicts": table.rr_conflicts,
             "default_reductions": table.default_reductions,
-            "start": table.grammar.start,
-            "terminals": sorted(table.grammar.terminals),
-            "precedence": table.grammar.precedence,
-            "productions": [
-                (p.name, p.prod, p.prec) for p in table.grammar.productions
-            ],
+            **self._grammar_metadata(table.grammar),
         }
 
     def data_is_valid(self, g: Grammar, data: dict):
-        if g.start != data["start"]:
-            return False
-        if sorted(g.terminals) != data["terminals"]:
-            return False
-        if sorted(g.precedence) != sorted(data["precedence"]):
-            return False
-        for key, (assoc, level) in iteritems(g.precedence):
-            if data["precedence"][key] != [assoc, level]:
-                return False
-        if len(g.productions) != len(data["productions"]):
-            return False
-        for p, (name, prod, (assoc, level)) in zip(g.productions, data["productions"]):
-            if p is None:
-                continue
-            if p.name != name:
-                return False
-            if p.prod != prod:
-                return False
-            if p.prec != (assoc, level):
-                return False
-        return True
+        """
+        Returns whether the cached `data` was built from the grammar `g`.
+
+        .. deprecated:: 0.7.7
+           :meth:`build` no longer calls this, the cache key identifies the
+           declarations the tables were built from.
+        """
+        warnings.warn(
+            "data_is_valid() is no longer used by build()",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        # Compare through JSON, which turns the tuples of both into lists.
+        expected = json.loads(json.dumps(self._grammar_metadata(g)))
+        return json.loads(json.dumps({k: data.get(k) for k in expected})) == expected
+
+    def _grammar_metadata(self, g: Grammar):
+        return {
+            "start": g.start,
+            "terminals": sorted(g.terminals),
+            "precedence": g.precedence,
+            "productions": [(p.name, p.prod, p.prec) for p in g.productions],
+        }
+
+    def build(
+        self,
+        eliminate_unit_productions: bool = False,
+        strip: bool = False,
+        lazy: bool | Literal["parse"] = False,
+        method: Literal["lalr", "slr"] = "lalr",
+        starts: list[str] | None = None,
+    ):
+        """
+        Builds the parser tables, or loads them from the cache, and returns
+        an :class:`~rply.parser.LRParser`.
+
+        If `eliminate_unit_productions` is true, unit productions like
+        ``expr : term`` with the action ``PASS(0)`` are bypassed, see
+        :meth:`LRTable.eliminate_unit_productions`.
+
+        If `strip` is true, the parser only keeps what it needs to parse, see
+        :meth:`LRTable.strip`.
+
+        If `lazy` is true, a :class:`~rply.parser.LazyLRParser` is returned
+        immediately, and the tables are built on a background thread, or when
+        the parser is first used if that happens earlier. With
+        ``lazy="parse"`` no thread is started and the tables are only built
+        when the parser is first used. Errors in the grammar are raised at
+        that point, and the productions must not be changed until then.
+
+        `method` is ``"lalr"`` to build LALR(1) tables, or ``"slr"`` to build
+        SLR(1) tables, which is faster. The SLR(1) tables are only used if
+        they have no conflicts, otherwise LALR(1) tables are built. They may
+        reduce by a few more productions before detecting a syntax error.
+
+        `starts` lists the nonterminals the parser can parse, the first of
+        which is parsed by default. Any of them can be chosen with the `start`
+        argument of :meth:`~rply.parser.LRParser.parse`. By default only the
+        name of the first production can be parsed.
+        """
+        if method not in ("lalr", "slr"):
+            raise ValueError("Unknown method %r, expected lalr or slr" % method)
+        if lazy:
+            return LazyLRParser(
+                lambda: self._build_table(
+                    eliminate_unit_productions, strip, method, starts
+                ),
+                self.error_handler,
+                background=lazy != "parse",
+            )
+        return LRParser(
+            self._build_table(eliminate_unit_productions, strip, method, starts),
+            self.error_handler,
+        )
+
+    def build_report(
+        self, trace_memory: bool = True, method: Literal["lalr", "slr"] = "lalr"
+    ) -> BuildReport:
+        """
+        Builds the parser tables, without using the cache, and returns a
+        :class:`~rply.report.BuildReport` of the time and memory taken by each
+        phase and the size of the tables.
+
+        Tracing memory with :mod:`tracemalloc` slows the build down, pass
+        `trace_memory` as false for more accurate times. `method` is passed
+        on as to :meth:`build`.
+        """
+        report = BuildReport()
+        g = self._make_grammar()
+        started = trace_memory and not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            with report.phase("build_lritems"):
+                g.build_lritems()
+            with report.phase("compute_first"):
+                g.compute_first()
+            with report.phase("compute_follow"):
+                g.compute_follow()
+            with report.phase("lr0"):
+                C, goto = LRTable.lr0_items(g)
+            table = None
+            if method == "slr":
+                with report.phase("lookaheads"):
+                    slr = LRTable.compute_slr_lookaheads(g, C, goto)
+                if slr is not None:
+                    with report.phase("actions"):
+                        table = LRTable.from_lookaheads(g, C, goto, *slr)
+                    if not LRTable.slr_table_is_usable(g, goto, table, *slr):
+                        table = None
+            if table is None:
+                with report.phase("lookaheads"):
+                    lookaheads, terminals = LRTable.compute_lalr_lookaheads(g, C, goto)
+                with report.phase("actions"):
+                    table = LRTable.from_lookaheads(g, C, goto, lookaheads, terminals)
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        report.productions = len(g.productions) - 1
+        report.states = len(C)
+        report.items = sum(len(I) for I in C)
+        for transitions in goto:
+            for sym in transitions:
+                if sym in g.nonterminals:
+                    report.nonterminal_transitions += 1
+                else:
+                    report.terminal_transitions += 1
+        report.action_density = sum(len(row) for row in table.lr_action) / (
+            len(C) * (len(g.terminals) + 1)
+        )
+        report.goto_density = sum(len(row) for row in table.lr_goto) / (
+            len(C) * max(len(g.nonterminals), 1)
+        )
+        report.sr_conflicts = len(table.sr_conflicts)
+        report.rr_conflicts = len(table.rr_conflicts)
+        return report
 
-    def build(self):
+    def _make_grammar(self, starts: list[str] | None = None) -> Grammar:
         g = Grammar(self.tokens)
 
         for level, (assoc, terms) in enumerate(self.precedence, 1):
@@ -170,107 +399,287 @@ class ParserGenerator(object):
         for prod_name, syms, func, precedence in self.productions:
             g.add_production(prod_name, syms, func, precedence)
 
-        g.set_start()
+        g.set_start(starts)
+        return g
+
+    def _build_table(
+        self,
+        eliminate_unit_productions: bool,
+        strip: bool,
+        method: str = "lalr",
+        starts: list[str] | None = None,
+    ):
+        g = self._make_grammar(starts)
 
         for unused_term in g.unused_terminals():
             warnings.warn(
-                "Token %r is unused" % unused_term, ParserGeneratorWarning, stacklevel=2
+                "Token %r is unused" % unused_term, ParserGeneratorWarning, stacklevel=3
             )
         for unused_prod in g.unused_productions():
             warnings.warn(
                 "Production %r is not reachable" % unused_prod,
                 ParserGeneratorWarning,
-                stacklevel=2,
+                stacklevel=3,
             )
 
-        g.build_lritems()
-        g.compute_first()
-        g.compute_follow()
-
         table = None
-        cache_dir = None
-        cache_file = None
+        cache_key = None
         if self.cache_id is not None:
-            cache_dir = AppDirs("rply").user_cache_dir
-            cache_file = os.path.join(
-                cache_dir,
-                "%s-%s-%s.json"
-                % (self.cache_id, self.VERSION, self.compute_grammar_hash(g)),
+            cache_key = "%s-%s-%s" % (
+                self.cache_id,
+                self.VERSION,
+                self.compute_grammar_hash(method, starts),
             )
-
-            if os.path.exists(cache_file):
-                with open(cache_file) as f:
-                    data = json.load(f)
-                if self.data_is_valid(g, data):
-                    table = LRTable.from_cache(g, data)
+            # The key identifies the declarations, so the tables can be used
+            # without analyzing the grammar.
+            data = self._load_cached(cache_key)
+            if data is not None:
+                table = LRTable.from_cache(g, data)
         if table is None:
-            table = LRTable.from_grammar(g)
-
-            if self.cache_id is not None:
-                self._write_cache(cache_dir, cache_file, table)
+            with contextlib.ExitStack() as stack:
+                if cache_key is not None:
+                    for backend in self.cache_backends:
+                        stack.enter_context(backend.lock(cache_key))
+                    # Another process may have built the tables while this
+                    # one was waiting for the lock.
+                    data = self._load_cached(cache_key)
+                    if data is not None:
+                        table = LRTable.from_cache(g, data)
+                if table is None:
+                    g.build_lritems()
+                    g.compute_first()
+                    g.compute_follow()
+                    table = LRTable.from_grammar(g, method=method)
+
+                    if cache_key is not None:
+                        data = self.serialize_table(table)
+                        for backend in self.cache_backends:
+                            backend.store(cache_key, data)
+        if eliminate_unit_productions:
+            table.eliminate_unit_productions()
+        if strip:
+            table.strip()
 
         if table.sr_conflicts:
             warnings.warn(
                 "%d shift/reduce conflict%s"
                 % (len(table.sr_conflicts), "s" if len(table.sr_conflicts) > 1 else ""),
                 ParserGeneratorWarning,
-                stacklevel=2,
+                stacklevel=3,
             )
         if table.rr_conflicts:
             warnings.warn(
                 "%d reduce/reduce conflict%s"
                 % (len(table.rr_conflicts), "s" if len(table.rr_conflicts) > 1 else ""),
                 ParserGeneratorWarning,
-                stacklevel=2,
+                stacklevel=3,
             )
+        return table
+
+    def attach_table(self, name: str | None = None, path: str | None = None):
+        """
+        Returns a parser reading its tables from the shared memory block
+        `name`, as returned by :meth:`rply.parser.LRParser.share`, or from the
+        file at `path`, as written by :func:`rply.sharedtable.write_table`.
+
+        No tables are built or copied; the productions defined on this
+        generator must be the ones the tables were built from.
+        """
+        if (name is None) == (path is None):
+            raise ValueError("Exactly one of name or path must be given")
+        if name is not None:
+            source = attach_shared_memory(name)
+        else:
+            source = map_table(path)
+        buffer = getattr(source, "buf", source)
+
+        funcs = [None] + [func for _, _, func, _ in self.productions]
+        table = SharedLRTable(buffer, funcs, keepalive=source)
+        if [(p.name, p.prod) for p in table.grammar.productions[1 : len(funcs)]] != [
+            (prod_name, syms) for prod_name, syms, _, _ in self.productions
+        ]:
+            raise ParserGeneratorError("Packed table does not match the grammar")
         return LRParser(table, self.error_handler)
 
-    def _write_cache(self, cache_dir, cache_file, table):
-        if not os.path.exists(cache_dir):
-            try:
-                os.makedirs(cache_dir, mode=0o0700)
-            except OSError as e:
-                if e.errno == errno.EROFS:
-                    return
-                raise
+    def generate_module(
+        self, path: str, code: bool = False, starts: list[str] | None = None
+    ):
+        """
+        Builds the parser tables and writes them to `path` as an importable
+        Python module, which :meth:`load_module` turns back into a parser
+        without building anything.
 
-        with tempfile.NamedTemporaryFile(dir=cache_dir, delete=False, mode="w") as f:
-            json.dump(self.serialize_table(table), f)
-        os.rename(f.name, cache_file)
+        This allows shipping prebuilt tables with a package instead of
+        building them, or reading them from the cache, at runtime.
 
+        If `code` is true, the module additionally contains a parser
+        specialized to the tables, see :mod:`rply.codegen`, which the parser
+        returned by :meth:`load_module` runs instead of interpreting them.
 
-def digraph(X, R, FP):
-    N = dict.fromkeys(X, 0)
-    stack = []
-    F = {}
-    for x in X:
-        if N[x] == 0:
-            traverse(x, N, stack, F, X, R, FP)
-    return F
+        `starts` is passed on to :meth:`build`.
+        """
+        self.write_module(self.build(starts=starts).lr_table, path, code)
+
+    def write_module(self, table: "LRTable", path: str, code: bool = False):
+        """
+        Writes `table`, built from this generator, to `path` like
+        :meth:`generate_module`.
+        """
+        funcs = [func for _, _, func, _ in self.productions]
+
+        lines = [
+            "# Parser tables generated by rply. Do not edit.",
+            "",
+            "VERSION = %r" % self.VERSION,
+            "start = %r" % table.grammar.start,
+            "starts = %r"
+            % (
+                [table.grammar.start]
+                + [p.prod[1] for p in table.grammar.productions[len(funcs) + 1 :]]
+            ),
+            "precedence = %r" % self._precedence_declarations(),
+            "productions = [",
+        ]
+        for prod_name, syms, _, precedence in self.productions:
+            lines.append("    %r," % ((prod_name, syms, precedence),))
+        lines.append("]")
+        for name in ["lr_action", "lr_goto"]:
+            lines.append("%s = [" % name)
+            for row in getattr(table, name):
+                lines.append("    %r," % (row,))
+            lines.append("]")
+        for name in ["default_reductions", "sr_conflicts", "rr_conflicts"]:
+            lines.append("%s = %r" % (name, getattr(table, name)))
+
+        if code:
+            lines.append(
+                "actions = %r"
+                % [repr(func) if isinstance(func, Action) else None for func in funcs]
+            )
+            lines += ["", "", generate_parser(table)]
+
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def load_module(self, module: types.ModuleType | str):
+        """
+        Returns a parser using the tables in `module`, a module (or the name
+        of one) written by :meth:`generate_module`. The tables are used as
+        they are, without analyzing the grammar.
+
+        Raises :exc:`ParserGeneratorError` if the module was generated from a
+        different grammar than the one defined on this generator.
+        """
+        if isinstance(module, str):
+            module = importlib.import_module(module)
+
+        if (
+            module.VERSION != self.VERSION
+            or module.precedence != self._precedence_declarations()
+            or module.productions
+            != [
+                (prod_name, syms, precedence)
+                for prod_name, syms, _, precedence in self.productions
+            ]
+        ):
+            raise ParserGeneratorError(
+                "Module %s does not match the grammar" % module.__name__
+            )
 
+        productions = [RuntimeProduction(0, "S'", [module.start], None)]
+        for num, (prod_name, syms, func, _) in enumerate(self.productions, 1):
+            productions.append(RuntimeProduction(num, prod_name, syms, func))
+        for name in getattr(module, "starts", [module.start])[1:]:
+            productions.append(
+                RuntimeProduction(
+                    len(productions), "S'", [START_PREFIX + name, name], None
+                )
+            )
+        table = LRTable(
+            RuntimeGrammar(module.start, productions),
+            module.lr_action,
+            module.lr_goto,
+            module.default_reductions,
+            module.sr_conflicts,
+            module.rr_conflicts,
+        )
+        if hasattr(module, "bind"):
+            # The generated code has the actions of productions inlined.
+            if module.actions != [
+                repr(func) if isinstance(func, Action) else None
+                for _, _, func, _ in self.productions
+            ]:
+                raise ParserGeneratorError(
+                    "Module %s does not match the grammar" % module.__name__
+                )
+            return GeneratedLRParser(table, self.error_handler, bind=module.bind)
+        return LRParser(table, self.error_handler)
+
+    def _precedence_declarations(self):
+        return [(assoc, list(terms)) for assoc, terms in self.precedence]
+
+    def _load_cached(self, key: str):
+        for i, backend in enumerate(self.cache_backends):
+            data = backend.load(key)
+            if data is not None:
+                for earlier in self.cache_backends[:i]:
+                    earlier.store(key, data)
+                return data
+        return None
+
+
+def digraph(R: list[list[int]], FP: list[int]) -> list[int]:
+    """
+    Computes ``F(x) = FP[x] | F(y) for every y in R[x]`` for the nodes
+    ``0..len(R) - 1`` of a relation, as described by DeRemer and Pennello.
+
+    Nodes are integers, `R` lists the nodes each node is related to and the
+    sets in `FP` and the returned list are bitsets. Nodes in a cycle end up
+    with the same set. The strongly connected components are found with an
+    explicit stack, so that long chains don't hit the recursion limit.
+    """
+    N = [0] * len(R)
+    F = list(FP)
+    stack = []
+    for root in range(len(R)):
+        if N[root]:
+            continue
+        stack.append(root)
+        N[root] = len(stack)
+        # The nodes being traversed, with their depth on `stack` and the
+        # index of the next related node to visit.
+        path = [[root, len(stack), 0]]
+        while path:
+            frame = path[-1]
+            x, d, i = frame
+            rel = R[x]
+            if i < len(rel):
+                frame[2] = i + 1
+                y = rel[i]
+                if N[y] == 0:
+                    stack.append(y)
+                    N[y] = len(stack)
+                    path.append([y, len(stack), 0])
+                    continue
+                if N[y] < N[x]:
+                    N[x] = N[y]
+                F[x] |= F[y]
+                continue
 
-def traverse(x, N, stack, F, X, R, FP):
-    stack.append(x)
-    d = len(stack)
-    N[x] = d
-    F[x] = FP(x)
-
-    rel = R(x)
-    for y in rel:
-        if N[y] == 0:
-            traverse(y, N, stack, F, X, R, FP)
-        N[x] = min(N[x], N[y])
-        for a in F.get(y, []):
-            if a not in F[x]:
-                F[x].append(a)
-    if N[x] == d:
-        N[stack[-1]] = LARGE_VALUE
-        F[stack[-1]] = F[x]
-        element = stack.pop()
-        while element != x:
-            N[stack[-1]] = LARGE_VALUE
-            F[stack[-1]] = F[x]
-            element = stack.pop()
+            path.pop()
+            if N[x] == d:
+                while True:
+                    element = stack.pop()
+                    N[element] = LARGE_VALUE
+                    F[element] = F[x]
+                    if element == x:
+                        break
+            if path:
+                parent = path[-1][0]
+                if N[x] < N[parent]:
+                    N[parent] = N[x]
+                F[parent] |= F[x]
+    return F
 
 
 class LRTable(object):
@@ -289,34 +698,51 @@ class LRTable(object):
         self.default_reductions = default_reductions
         self.sr_conflicts = sr_conflicts
         self.rr_conflicts = rr_conflicts
+        # Whether any state can shift the error token, that is whether error
+        # recovery is possible at all.
+        self.has_error_rules = any("error" in actions for actions in lr_action)
 
     @classmethod
     def from_cache(cls, grammar: Grammar, data: dict):
-        lr_action = [
-            dict([(str(k), v) for k, v in iteritems(action)])
-            for action in data["lr_action"]
-        ]
-        lr_goto = [
-            dict([(str(k), v) for k, v in iteritems(goto)]) for goto in data["lr_goto"]
-        ]
+        # Both JSON and marshal give the dicts with their keys as they were.
         return LRTable(
             grammar,
-            lr_action,
-            lr_goto,
+            data["lr_action"],
+            data["lr_goto"],
             data["default_reductions"],
             data["sr_conflicts"],
             data["rr_conflicts"],
         )
 
     @classmethod
-    def from_grammar(cls, grammar: Grammar):
-        cidhash = IdentityDict()
-        goto_cache = {}
-        add_count = Counter()
-        C = cls.lr0_items(grammar, add_count, cidhash, goto_cache)
-
-        cls.add_lalr_lookaheads(grammar, C, add_count, cidhash, goto_cache)
+    def from_grammar(
+        cls,
+        grammar: Grammar,
+        eliminate_unit_productions: bool = False,
+        method: Literal["lalr", "slr"] = "lalr",
+    ):
+        C, goto = cls.lr0_items(grammar)
+        table = None
+        if method == "slr":
+            slr = cls.compute_slr_lookaheads(grammar, C, goto)
+            if slr is not None:
+                table = cls.from_lookaheads(grammar, C, goto, *slr)
+                if not cls.slr_table_is_usable(grammar, goto, table, *slr):
+                    table = None
+        if table is None:
+            lookaheads, terminals = cls.compute_lalr_lookaheads(grammar, C, goto)
+            table = cls.from_lookaheads(grammar, C, goto, lookaheads, terminals)
+        if eliminate_unit_productions:
+            table.eliminate_unit_productions()
+        return table
 
+    @classmethod
+    def from_lookaheads(cls, grammar, C, goto, lookaheads, terminals):
+        """
+        Returns the table for the LR(0) item sets `C` and transitions `goto`,
+        reducing completed items on their lookaheads, given as bit sets of
+        `terminals` keyed by state and production number.
+        """
         lr_action = [None] * len(C)
         lr_goto = [None] * len(C)
         sr_conflicts = []
@@ -326,14 +752,18 @@ class LRTable(object):
             st_actionp = {}
             st_goto = {}
             for p in I:
-                if p.getlength() == p.lr_index + 1:
+                prod = p.production.prod
+                if p.lr_index == len(prod):
                     if p.name == "S'":
                         # Start symbol. Accept!
                         st_action["$end"] = 0
                         st_actionp["$end"] = p
                     else:
-                        laheads = p.lookaheads[st]
-                        for a in laheads:
+                        laheads = lookaheads.get((st, p.number), 0)
+                        while laheads:
+                            low = laheads & -laheads
+                            laheads ^= low
+                            a = terminals[low.bit_length() - 1]
                             if a in st_action:
                                 r = st_action[a]
                                 if r > 0:
@@ -377,11 +807,9 @@ class LRTable(object):
                                 st_actionp[a] = p
                                 grammar.productions[p.number].reduced += 1
                 else:
-                    i = p.lr_index
-                    a = p.prod[i + 1]
+                    a = prod[p.lr_index]
                     if a in grammar.terminals:
-                        g = cls.lr0_goto(I, a, add_count, goto_cache)
-                        j = cidhash.get(g, -1)
+                        j = goto[st].get(a, -1)
                         if j >= 0:
                             if a in st_action:
                                 r = st_action[a]
@@ -417,15 +845,8 @@ class LRTable(object):
                             else:
                                 st_action[a] = j
                                 st_actionp[a] = p
-            nkeys = set()
-            for ii in I:
-                for s in ii.unique_syms:
-                    if s in grammar.nonterminals:
-                        nkeys.add(s)
-            for n in nkeys:
-                g = cls.lr0_goto(I, n, add_count, goto_cache)
-                j = cidhash.get(g, -1)
-                if j >= 0:
+            for n, j in iteritems(goto[st]):
+                if n in grammar.nonterminals:
                     st_goto[n] = j
 
             lr_action[st] = st_action
@@ -440,82 +861,230 @@ class LRTable(object):
             grammar, lr_action, lr_goto, default_reductions, sr_conflicts, rr_conflicts
         )
 
+    def strip(self):
+        """
+        Replaces :attr:`grammar` with a :class:`~rply.grammar.RuntimeGrammar`
+        holding only the productions' names, symbols and functions, so that
+        the items and FIRST and FOLLOW sets used to build the table can be
+        freed.
+        """
+        self.grammar = RuntimeGrammar(
+            self.grammar.start,
+            [
+                RuntimeProduction(p.number, p.name, p.prod, p.func)
+                for p in self.grammar.productions
+            ],
+        )
+
+    def eliminate_unit_productions(self):
+        """
+        Rewrites the goto table so that the parser never enters states that
+        only reduce a unit production with the action ``PASS(0)``.
+
+        Such a reduction pops the state it was entered with and leaves the
+        value on the stack alone, so a goto leading into the state can lead
+        to where the reduction would go instead. A chain of unit productions,
+        like ``expr : term`` and ``term : factor``, thereby collapses into a
+        single goto. Input is accepted and rejected at the same tokens as
+        before, but the bypassed productions don't appear in the trees built
+        by :meth:`~rply.parser.LRParser.parse_tree`.
+        """
+        identity = PASS(0)
+        units = {}
+        for state, default in enumerate(self.default_reductions):
+            if default:
+                p = self.grammar.productions[-default]
+                if p.getlength() == 1 and p.action == identity:
+                    units[state] = p.name
+
+        # The rows are replaced rather than modified, since cached tables may
+        # be shared with other parsers.
+        lr_goto = []
+        for gotos in self.lr_goto:
+            st_goto = {}
+            for name, target in gotos.items():
+                seen = set()
+                while target in units and target not in seen:
+                    seen.add(target)
+                    target = gotos[units[target]]
+                st_goto[name] = target
+            lr_goto.append(st_goto)
+        self.lr_goto = lr_goto
+
     @classmethod
-    def lr0_items(cls, grammar, add_count, cidhash, goto_cache):
-        C = [cls.lr0_closure([grammar.productions[0].lr_next], add_count)]
-        for i, I in enumerate(C):
-            cidhash[I] = i
-
-        i = 0
-        while i < len(C):
-            I = C[i]
-            i += 1
-
-            asyms = set()
-            for ii in I:
-                asyms.update(ii.unique_syms)
-            for x in asyms:
-                g = cls.lr0_goto(I, x, add_count, goto_cache)
-                if not g:
-                    continue
-                if g in cidhash:
-                    continue
-                cidhash[g] = len(C)
-                C.append(g)
-        return C
+    def lr0_items(cls, grammar):
+        """
+        Returns the LR(0) item sets of `grammar`, as lists of items, and the
+        transitions between them, as dicts mapping symbols to item sets.
+
+        Items are identified by consecutive integers, so that the item after
+        the one with id ``i`` has the id ``i + 1``. An item set is identified
+        by the sorted tuple of the ids of its kernel items, which are kept in
+        the order they were first found in.
+        """
+        items = []
+        offsets = []
+        for p in grammar.productions:
+            offsets.append(len(items))
+            items.extend(p.lr_items)
+        next_syms = [
+            item.production.prod[item.lr_index]
+            if item.lr_index < len(item.production)
+            else None
+            for item in items
+        ]
+        first_items = cls.lr0_first_items(grammar, offsets)
+
+        # The augmented start productions, the first and one for each other
+        # start symbol.
+        start = [offsets[p.number] for p in grammar.productions if p.name == "S'"]
+        kernels = {tuple(start): 0}
+        queue = [start]
+        C = []
+        goto = []
+        for kernel in queue:
+            closure = cls.lr0_closure(kernel, next_syms, first_items)
+            C.append([items[i] for i in closure])
+
+            successors = {}
+            for i in closure:
+                x = next_syms[i]
+                if x is not None:
+                    successors.setdefault(x, []).append(i + 1)
+            st_goto = {}
+            for x, successor in iteritems(successors):
+                key = tuple(sorted(successor))
+                j = kernels.get(key)
+                if j is None:
+                    j = kernels[key] = len(queue)
+                    queue.append(successor)
+                st_goto[x] = j
+            goto.append(st_goto)
+        return C, goto
+
+    @classmethod
+    def lr0_first_items(cls, grammar, offsets):
+        """
+        Returns a dict mapping each nonterminal to the ids of the first items
+        of its productions. `offsets` are the ids of the first item of each
+        production.
+        """
+        return {
+            n: [offsets[p.number] for p in grammar.prod_names.get(n, [])]
+            for n in grammar.nonterminals
+        }
 
     @classmethod
-    def lr0_closure(cls, I, add_count):
-        add_count.incr()
-
-        J = I[:]
-        added = True
-        while added:
-            added = False
-            for j in J:
-                for x in j.lr_after:
-                    if x.lr0_added == add_count.value:
-                        continue
-                    J.append(x.lr_next)
-                    x.lr0_added = add_count.value
-                    added = True
-        return J
+    def lr0_closure(cls, kernel, next_syms, first_items):
+        # The kernel items come first, followed by the items of each
+        # nonterminal in the order they are needed. Conflicts are resolved by
+        # the order of the items, so it has to stay the same.
+        closure = list(kernel)
+        added = set()
+        for i in closure:
+            x = next_syms[i]
+            if x not in added and x in first_items:
+                added.add(x)
+                closure.extend(first_items[x])
+        return closure
 
     @classmethod
-    def lr0_goto(cls, I, x, add_count, goto_cache):
-        s = goto_cache.setdefault(x, IdentityDict())
-
-        gs = []
-        for p in I:
-            n = p.lr_next
-            if n and n.lr_before == x:
-                s1 = s.get(n)
-                if not s1:
-                    s1 = {}
-                    s[n] = s1
-                gs.append(n)
-                s = s1
-        g = s.get("$end")
-        if not g:
-            if gs:
-                g = cls.lr0_closure(gs, add_count)
-                s["$end"] = g
-            else:
-                s["$end"] = gs
-        return g
+    def compute_slr_lookaheads(cls, grammar, C, goto):
+        """
+        Returns the SLR(1) lookaheads of the completed items in the item sets
+        `C`, which are the FOLLOW sets of their productions' names, like
+        :meth:`compute_lalr_lookaheads`, or ``None`` if a reduction conflicts
+        with accepting the input.
+        """
+        terminals = sorted(grammar.terminals) + ["$end"]
+        bits = {t: 1 << i for i, t in enumerate(terminals)}
+        follow = {}
+        for name, f in iteritems(grammar.follow):
+            follow[name] = sum(bits[t] for t in f)
+
+        lookaheads = {}
+        for st, I in enumerate(C):
+            accepting = False
+            reduced = 0
+            for p in I:
+                if p.lr_index != len(p.production):
+                    continue
+                if p.name == "S'":
+                    accepting = True
+                else:
+                    lookaheads[(st, p.number)] = follow[p.name]
+                    reduced |= follow[p.name]
+            if accepting and reduced & bits["$end"]:
+                return None
+        return lookaheads, terminals
 
     @classmethod
-    def add_lalr_lookaheads(cls, grammar, C, add_count, cidhash, goto_cache):
+    def slr_table_is_usable(cls, grammar, goto, table, lookaheads, terminals):
+        """
+        Returns whether `table`, built from the SLR(1) `lookaheads`, parses
+        the same input as the LALR(1) table would.
+
+        It mustn't have any conflict precedence doesn't resolve. The FOLLOW
+        sets may also hold terminals the LALR(1) lookaheads don't, so where
+        precedence drops a shift in favor of a reduction or an error, the
+        terminal has to be one that can be shifted right after the reduction,
+        from one of the states the reduction returns to. This is enough for
+        the usual expression grammars, but stricter than needed.
+        """
+        if table.sr_conflicts or table.rr_conflicts:
+            return False
+        bits = {t: 1 << i for i, t in enumerate(terminals)}
+        predecessors = None
+        for (st, number), laheads in iteritems(lookaheads):
+            for a, j in iteritems(goto[st]):
+                if (
+                    a not in grammar.terminals
+                    or not laheads & bits[a]
+                    or table.lr_action[st].get(a) == j
+                ):
+                    continue
+                if predecessors is None:
+                    predecessors = [[] for _ in goto]
+                    for q, st_goto in enumerate(goto):
+                        for target in itervalues(st_goto):
+                            predecessors[target].append(q)
+                # The states the reduction goes back to.
+                p = grammar.productions[number]
+                states = {st}
+                for x in reversed(p.prod):
+                    states = {
+                        q
+                        for target in states
+                        for q in predecessors[target]
+                        if goto[q].get(x) == target
+                    }
+                if not any(a in goto[goto[q][p.name]] for q in states):
+                    return False
+        return True
+
+    @classmethod
+    def compute_lalr_lookaheads(cls, grammar, C, goto):
+        """
+        Returns the LALR(1) lookaheads of the completed items in the item sets
+        `C`, as a dict mapping ``(state, production number)`` to a bitset,
+        and the list of terminals the bits stand for.
+        """
         nullable = cls.compute_nullable_nonterminals(grammar)
-        trans = cls.find_nonterminal_transitions(grammar, C)
+        trans = cls.find_nonterminal_transitions(grammar, goto)
+        # Transitions are numbered by their position in `trans`, and sets of
+        # terminals are bitsets with a bit per position in `terminals`.
+        trans_ids = {t: i for i, t in enumerate(trans)}
+        terminals = sorted(grammar.terminals) + ["$end"]
+        bits = {t: 1 << i for i, t in enumerate(terminals)}
+
         readsets = cls.compute_read_sets(
-            grammar, C, trans, nullable, add_count, cidhash, goto_cache
+            grammar, C, goto, trans, trans_ids, nullable, bits
         )
         lookd, included = cls.compute_lookback_includes(
-            grammar, C, trans, nullable, add_count, cidhash, goto_cache
+            grammar, C, goto, trans, nullable
         )
-        followsets = cls.compute_follow_sets(trans, readsets, included)
-        cls.add_lookaheads(lookd, followsets)
+        followsets = cls.compute_follow_sets(trans, trans_ids, readsets, included)
+        return cls.collect_lookaheads(lookd, trans_ids, followsets), terminals
 
     @classmethod
     def compute_nullable_nonterminals(cls, grammar):
@@ -537,114 +1106,106 @@ class LRTable(object):
         return nullable
 
     @classmethod
-    def find_nonterminal_transitions(cls, grammar, C):
+    def find_nonterminal_transitions(cls, grammar, goto):
         trans = []
-        for idx, state in enumerate(C):
-            for p in state:
-                if p.lr_index < p.getlength() - 1:
-                    t = (idx, p.prod[p.lr_index + 1])
-                    if t[1] in grammar.nonterminals and t not in trans:
-                        trans.append(t)
+        for state, st_goto in enumerate(goto):
+            for x in st_goto:
+                if x in grammar.nonterminals:
+                    trans.append((state, x))
         return trans
 
     @classmethod
-    def compute_read_sets(
-        cls, grammar, C, ntrans, nullable, add_count, cidhash, goto_cache
-    ):
+    def compute_read_sets(cls, grammar, C, goto, ntrans, trans_ids, nullable, bits):
         return digraph(
-            ntrans,
-            R=lambda x: cls.reads_relation(
-                C, x, nullable, add_count, cidhash, goto_cache
-            ),
-            FP=lambda x: cls.dr_relation(
-                grammar, C, x, nullable, add_count, goto_cache
-            ),
+            [cls.reads_relation(C, goto, x, trans_ids, nullable) for x in ntrans],
+            [cls.dr_relation(grammar, C, goto, x, bits) for x in ntrans],
         )
 
     @classmethod
-    def compute_follow_sets(cls, ntrans, readsets, includesets):
+    def compute_follow_sets(cls, ntrans, trans_ids, readsets, includesets):
         return digraph(
-            ntrans,
-            R=lambda x: includesets.get(x, []),
-            FP=lambda x: readsets[x],
+            [[trans_ids[y] for y in includesets.get(x, [])] for x in ntrans],
+            readsets,
         )
 
     @classmethod
-    def dr_relation(cls, grammar, C, trans, nullable, add_count, goto_cache):
+    def dr_relation(cls, grammar, C, goto, trans, bits):
         state, N = trans
-        terms = []
-
-        g = cls.lr0_goto(C[state], N, add_count, goto_cache)
-        for p in g:
-            if p.lr_index < p.getlength() - 1:
-                a = p.prod[p.lr_index + 1]
-                if a in grammar.terminals and a not in terms:
-                    terms.append(a)
-        if state == 0 and N == grammar.productions[0].prod[0]:
-            terms.append("$end")
+        terms = 0
+
+        for p in C[goto[state][N]]:
+            if p.lr_index < len(p.production):
+                a = p.production.prod[p.lr_index]
+                if a in grammar.terminals:
+                    terms |= bits[a]
+        if N in grammar.starts:
+            # The end of the input may follow a start symbol, after the start
+            # token selecting it if it isn't the first.
+            if N == grammar.start:
+                start_state = 0
+            else:
+                start_state = goto[0][START_PREFIX + N]
+            if state == start_state:
+                terms |= bits["$end"]
         return terms
 
     @classmethod
-    def reads_relation(cls, C, trans, empty, add_count, cidhash, goto_cache):
+    def reads_relation(cls, C, goto, trans, trans_ids, empty):
         rel = []
         state, N = trans
 
-        g = cls.lr0_goto(C[state], N, add_count, goto_cache)
-        j = cidhash.get(g, -1)
-        for p in g:
-            if p.lr_index < p.getlength() - 1:
-                a = p.prod[p.lr_index + 1]
+        j = goto[state][N]
+        for p in C[j]:
+            if p.lr_index < len(p.production):
+                a = p.production.prod[p.lr_index]
                 if a in empty:
-                    rel.append((j, a))
+                    rel.append(trans_ids[j, a])
         return rel
 
     @classmethod
-    def compute_lookback_includes(
-        cls, grammar, C, trans, nullable, add_count, cidhash, goto_cache
-    ):
+    def compute_lookback_includes(cls, grammar, C, goto, trans, nullable):
         lookdict = {}
         includedict = {}
 
         dtrans = dict.fromkeys(trans, 1)
 
+        # The items of each state, by the name of their production.
+        by_name = []
+        for I in C:
+            names = {}
+            for p in I:
+                names.setdefault(p.production.name, []).append(p)
+            by_name.append(names)
+
+        # For each production and position, whether the symbols after it can
+        # all derive the empty string.
+        nullable_tails = []
+        for p in grammar.productions:
+            tails = [False] * len(p.prod)
+            tail = True
+            for i in range(len(p.prod) - 1, -1, -1):
+                tails[i] = tail
+                tail = tail and p.prod[i] in nullable
+            nullable_tails.append(tails)
+
         for state, N in trans:
             lookb = []
             includes = []
-            for p in C[state]:
-                if p.name != N:
-                    continue
-
-                lr_index = p.lr_index
+            for p in by_name[state].get(N, ()):
+                prod = p.production.prod
+                tails = nullable_tails[p.production.number]
                 j = state
-                while lr_index < p.getlength() - 1:
-                    lr_index += 1
-                    t = p.prod[lr_index]
-
-                    if (j, t) in dtrans:
-                        li = lr_index + 1
-                        while li < p.getlength():
-                            if p.prod[li] in grammar.terminals:
-                                break
-                            if p.prod[li] not in nullable:
-                                break
-                            li += 1
-                        else:
-                            includes.append((j, t))
-
-                    g = cls.lr0_goto(C[j], t, add_count, goto_cache)
-                    j = cidhash.get(g, -1)
-
-                for r in C[j]:
-                    if r.name != p.name:
-                        continue
-                    if r.getlength() != p.getlength():
-                        continue
-                    i = 0
-                    while i < r.lr_index:
-                        if r.prod[i] != p.prod[i + 1]:
-                            break
-                        i += 1
-                    else:
+                for lr_index in range(p.lr_index, len(prod)):
+                    t = prod[lr_index]
+                    if tails[lr_index] and (j, t) in dtrans:
+                        includes.append((j, t))
+                    j = goto[j][t]
+
+                if p.lr_index:
+                    continue
+                # Only the lookaheads of completed items are used.
+                for r in by_name[j][N]:
+                    if r.lr_index == len(prod) and r.production.prod == prod:
                         lookb.append((j, r))
 
             for i in includes:
@@ -653,11 +1214,11 @@ class LRTable(object):
         return lookdict, includedict
 
     @classmethod
-    def add_lookaheads(cls, lookbacks, followset):
+    def collect_lookaheads(cls, lookbacks, trans_ids, followset):
+        lookaheads = {}
         for trans, lb in iteritems(lookbacks):
+            f = followset[trans_ids[trans]]
             for state, p in lb:
-                f = followset.get(trans, [])
-                laheads = p.lookaheads.setdefault(state, [])
-                for a in f:
-                    if a not in laheads:
-                        laheads.append(a)
+                key = (state, p.number)
+                lookaheads[key] = lookaheads.get(key, 0) | f
+        return lookaheads
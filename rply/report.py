@@ -0,0 +1,69 @@
+"""
+Statistics about building the tables of a grammar, see
+:meth:`rply.ParserGenerator.build_report`.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+
+@dataclass
+class PhaseReport:
+    """
+    The cost of one phase of building the tables.
+    """
+
+    name: str
+    #: The wall time in seconds.
+    time: float
+    #: The peak memory allocated during the phase in bytes, if it was traced.
+    peak_memory: int | None = None
+
+
+@dataclass
+class BuildReport:
+    """
+    The cost of each phase of building the tables of a grammar, and the size
+    of the result.
+    """
+
+    phases: list[PhaseReport] = field(default_factory=list)
+    productions: int = 0
+    states: int = 0
+    #: The number of LR(0) items in all states, including closures.
+    items: int = 0
+    terminal_transitions: int = 0
+    nonterminal_transitions: int = 0
+    #: The fraction of entries of the action table that are filled.
+    action_density: float = 0.0
+    #: The fraction of entries of the goto table that are filled.
+    goto_density: float = 0.0
+    sr_conflicts: int = 0
+    rr_conflicts: int = 0
+
+    @property
+    def time(self) -> float:
+        """
+        The wall time of all phases in seconds.
+        """
+        return sum(phase.time for phase in self.phases)
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Measures the code run in the block as the phase `name`. Memory is
+        only measured if :mod:`tracemalloc` is tracing.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - baseline if tracing else None
+        self.phases.append(PhaseReport(name, elapsed, peak))
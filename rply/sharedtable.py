@@ -0,0 +1,278 @@
+"""
+Flat, immutable parser tables that can be placed in shared memory or a
+memory-mapped file.
+
+A table built by :meth:`rply.ParserGenerator.build` is made of many small
+dicts. Forked worker processes touch their reference counts while parsing,
+which makes copy-on-write duplicate those pages in every worker. The format
+below stores the action, goto and default reduction tables as dense arrays
+of native ints instead, so any number of processes can parse against the
+same pages.
+
+Layout of a packed table::
+
+    header      struct HEADER
+    metadata    JSON: symbol names, productions and conflicts
+    lr_action   int32[nstates * nterminals]
+    lr_goto     int32[nstates * nnonterminals]
+    defaults    int32[nstates]
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Any, Callable
+
+from rply.errors import ParserGeneratorError
+from rply.grammar import RuntimeGrammar, RuntimeProduction
+
+if TYPE_CHECKING:
+    from rply.parsergenerator import LRTable
+
+# Where Linux exposes POSIX shared memory blocks as files.
+SHM_DIR = "/dev/shm"
+
+MAGIC = b"RPLYTAB\x00"
+FORMAT_VERSION = 1
+# magic, format version, metadata length, states, terminals, nonterminals
+HEADER = struct.Struct("<8sIIIII")
+
+NO_ACTION = -(2**31)
+NO_GOTO = -1
+
+
+class _Row(Mapping):
+    __slots__ = ("_data", "_base", "_columns", "_missing")
+
+    def __init__(self, data, base: int, columns: dict[str, int], missing: int):
+        self._data = data
+        self._base = base
+        self._columns = columns
+        self._missing = missing
+
+    def __getitem__(self, key: str):
+        column = self._columns.get(key)
+        if column is not None:
+            value = self._data[self._base + column]
+            if value != self._missing:
+                return value
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        column = self._columns.get(key)
+        return column is not None and self._data[self._base + column] != self._missing
+
+    def __iter__(self):
+        for key, column in self._columns.items():
+            if self._data[self._base + column] != self._missing:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _Rows(Sequence):
+    def __init__(self, data, nstates: int, columns: dict[str, int], missing: int):
+        self._data = data
+        self._nstates = nstates
+        self._columns = columns
+        self._width = len(columns)
+        self._missing = missing
+
+    def __getitem__(self, state):
+        if isinstance(state, slice):
+            return [self[i] for i in range(*state.indices(self._nstates))]
+        if state < 0:
+            state += self._nstates
+        if not 0 <= state < self._nstates:
+            raise IndexError(state)
+        return _Row(self._data, state * self._width, self._columns, self._missing)
+
+    def __len__(self):
+        return self._nstates
+
+
+def pack_table(table: LRTable) -> bytes:
+    """
+    Returns `table` in the flat format described in the module docstring.
+    """
+    terminals = sorted({t for actions in table.lr_action for t in actions})
+    nonterminals = sorted({n for gotos in table.lr_goto for n in gotos})
+    nstates = len(table.lr_action)
+
+    metadata = json.dumps(
+        {
+            "byteorder": sys.byteorder,
+            "start": table.grammar.start,
+            "terminals": terminals,
+            "nonterminals": nonterminals,
+            "productions": [(p.name, p.prod) for p in table.grammar.productions],
+            "sr_conflicts": table.sr_conflicts,
+            "rr_conflicts": table.rr_conflicts,
+        }
+    ).encode()
+    # Keep the int32 arrays aligned.
+    metadata += b" " * (-len(metadata) % 4)
+
+    term_columns = {t: i for i, t in enumerate(terminals)}
+    lr_action = array("i", [NO_ACTION]) * (nstates * len(terminals))
+    for state, actions in enumerate(table.lr_action):
+        base = state * len(terminals)
+        for t, action in actions.items():
+            lr_action[base + term_columns[t]] = action
+
+    nonterm_columns = {n: i for i, n in enumerate(nonterminals)}
+    lr_goto = array("i", [NO_GOTO]) * (nstates * len(nonterminals))
+    for state, gotos in enumerate(table.lr_goto):
+        base = state * len(nonterminals)
+        for n, target in gotos.items():
+            lr_goto[base + nonterm_columns[n]] = target
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        len(metadata),
+        nstates,
+        len(terminals),
+        len(nonterminals),
+    )
+    return b"".join(
+        [
+            header,
+            metadata,
+            lr_action.tobytes(),
+            lr_goto.tobytes(),
+            array("i", table.default_reductions).tobytes(),
+        ]
+    )
+
+
+class SharedLRTable:
+    """
+    A parser table that reads its actions directly out of a buffer produced
+    by :func:`pack_table`, without copying them into Python objects.
+
+    Only the symbol names, production metadata and conflicts are decoded
+    when the table is opened; they are small compared to the tables.
+
+    :param buffer: Any object supporting the buffer protocol.
+    :param funcs: The production functions, indexed by production number.
+                  The start productions of additional start symbols at the
+                  end may be left out.
+    :param keepalive: An object owning `buffer`, kept alive as long as the
+                      table is.
+    """
+
+    def __init__(self, buffer, funcs: list[Callable | None], keepalive: Any = None):
+        view = memoryview(buffer)
+        magic, version, meta_len, nstates, nterms, nnonterms = HEADER.unpack_from(view)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ParserGeneratorError("Not a packed parser table")
+        offset = HEADER.size
+        metadata = json.loads(bytes(view[offset : offset + meta_len]))
+        if metadata["byteorder"] != sys.byteorder:
+            raise ParserGeneratorError("Packed table has a different byte order")
+        offset += meta_len
+
+        productions = metadata["productions"]
+        if len(funcs) > len(productions) or any(
+            name != "S'" for name, _ in productions[len(funcs) :]
+        ):
+            raise ParserGeneratorError("Packed table does not match the grammar")
+        funcs = list(funcs) + [None] * (len(productions) - len(funcs))
+
+        def ints(count: int):
+            nonlocal offset
+            data = view[offset : offset + 4 * count].cast("i")
+            offset += 4 * count
+            return data
+
+        action_data = ints(nstates * nterms)
+        goto_data = ints(nstates * nnonterms)
+        self.default_reductions = ints(nstates)
+
+        self.lr_action = _Rows(
+            action_data,
+            nstates,
+            {t: i for i, t in enumerate(metadata["terminals"])},
+            NO_ACTION,
+        )
+        self.lr_goto = _Rows(
+            goto_data,
+            nstates,
+            {n: i for i, n in enumerate(metadata["nonterminals"])},
+            NO_GOTO,
+        )
+        self.sr_conflicts = metadata["sr_conflicts"]
+        self.rr_conflicts = metadata["rr_conflicts"]
+        # Only terminals with an action in some state get a column.
+        self.has_error_rules = "error" in metadata["terminals"]
+        self.grammar = RuntimeGrammar(
+            metadata["start"],
+            [
+                RuntimeProduction(num, name, prod, func)
+                for num, ((name, prod), func) in enumerate(zip(productions, funcs))
+            ],
+        )
+        self._keepalive = keepalive
+
+
+def export_shared_memory(
+    table: LRTable, name: str | None = None
+) -> shared_memory.SharedMemory:
+    """
+    Copies `table` into a new block of shared memory and returns it.
+
+    The caller owns the block and is responsible for calling
+    :meth:`~multiprocessing.shared_memory.SharedMemory.unlink` once no
+    process needs it anymore.
+    """
+    data = pack_table(table)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+    shm.buf[: len(data)] = data
+    return shm
+
+
+def attach_shared_memory(name: str) -> mmap.mmap | shared_memory.SharedMemory:
+    """
+    Attaches to a block created by :func:`export_shared_memory`, without
+    taking over responsibility for unlinking it.
+
+    Where the blocks are files in :data:`SHM_DIR`, as on Linux, the block is
+    mapped read-only from there. Elsewhere it is attached through
+    :class:`~multiprocessing.shared_memory.SharedMemory`. Before Python 3.13,
+    that registers the block with the resource tracker on POSIX systems,
+    which unlinks it when the attaching process exits.
+    """
+    if os.path.isdir(SHM_DIR):
+        fd = os.open(os.path.join(SHM_DIR, name), os.O_RDONLY)
+        try:
+            return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def write_table(table: LRTable, path: str):
+    """
+    Writes `table` to `path`, to be memory-mapped with :func:`map_table`.
+    """
+    with open(path, "wb") as f:
+        f.write(pack_table(table))
+
+
+def map_table(path: str) -> mmap.mmap:
+    """
+    Memory-maps a table file written by :func:`write_table` read-only.
+    """
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,89 @@
+import pickle
+
+from rply import ParserGenerator, Token
+from rply.arena import ERROR, TOKEN
+
+
+def make_parser(error_rule=False):
+    pg = ParserGenerator(["NAME", "EQUALS", "SEMI"])
+
+    def never_called(p):
+        raise AssertionError("production functions must not be called")
+
+    pg.production("main : stmts")(never_called)
+    pg.production("stmts : stmts stmt")(never_called)
+    pg.production("stmts :")(never_called)
+    pg.production("stmt : NAME EQUALS NAME SEMI")(never_called)
+
+    if error_rule:
+        pg.production("stmt : error SEMI")(never_called)
+
+        @pg.error
+        def error_handler(token):
+            pass
+
+    return pg.build()
+
+
+def tokens(*names):
+    return iter([Token(name, str(i)) for i, name in enumerate(names)])
+
+
+class TestTreeArena(object):
+    def test_tree(self):
+        arena = make_parser().parse_tree(
+            tokens("NAME", "EQUALS", "NAME", "SEMI", "NAME", "EQUALS", "NAME", "SEMI")
+        )
+
+        root = arena.root
+        assert root.name == "main"
+        assert root.span == (0, 8)
+        assert len(arena.tokens) == 8
+
+        stmts = [node for node in arena.find_all("stmt")]
+        assert [node.span for node in stmts] == [(0, 4), (4, 8)]
+        assert [child.name for child in stmts[1]] == ["NAME", "EQUALS", "NAME", "SEMI"]
+        assert stmts[1][2].is_token
+        assert stmts[1][2].kind == TOKEN
+        assert stmts[1][2].token == Token("NAME", "6")
+        assert [t.value for t in stmts[0].tokens] == ["0", "1", "2", "3"]
+
+        empty = list(arena.find_all("stmts"))[-1]
+        assert len(empty) == 0
+        assert empty.span == (0, 0)
+
+        # Children are created before their parents.
+        for node in arena.walk():
+            for child in node.children:
+                assert child.id < node.id
+
+    def test_subtree_and_pickle(self):
+        arena = make_parser().parse_tree(
+            tokens("NAME", "EQUALS", "NAME", "SEMI", "NAME", "EQUALS", "NAME", "SEMI")
+        )
+        second = list(arena.find_all("stmt"))[1]
+
+        sub = arena.subtree(second.id)
+        assert len(sub) == 5
+        assert sub.root.name == "stmt"
+        assert sub.root.span == (0, 4)
+        assert [t.value for t in sub.tokens] == ["4", "5", "6", "7"]
+        assert [child.token.value for child in sub.root] == ["4", "5", "6", "7"]
+
+        copy = pickle.loads(pickle.dumps(arena))
+        assert [(n.name, n.span) for n in copy.walk()] == [
+            (n.name, n.span) for n in arena.walk()
+        ]
+
+    def test_error_node(self):
+        arena = make_parser(error_rule=True).parse_tree(
+            tokens("NAME", "EQUALS", "SEMI", "NAME", "EQUALS", "NAME", "SEMI")
+        )
+
+        stmts = list(arena.find_all("stmt"))
+        assert len(stmts) == 2
+        error = stmts[0][0]
+        assert error.kind == ERROR
+        assert error.name == "error"
+        assert error.token == Token("error", "2")
+        assert stmts[1].span == (3, 7)
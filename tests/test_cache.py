@@ -0,0 +1,218 @@
+import marshal
+import multiprocessing
+import os
+import time
+
+from pytest import mark, raises
+
+from rply import PASS, ParserGenerator, Token, cache
+from rply.__main__ import main
+from rply.parsergenerator import LRTable
+
+
+TABLES = {
+    "lr_action": [{"VALUE": 2}, {"$end": 0}, {"$end": -1}],
+    "lr_goto": [{"main": 1}, {}, {}],
+    "default_reductions": [0, 0, -1],
+    "sr_conflicts": [],
+    "rr_conflicts": [],
+}
+
+
+class TestFormats(object):
+    @mark.parametrize("format", cache.FORMATS)
+    def test_roundtrip(self, format, tmp_path):
+        path = tmp_path / "tables"
+        path.write_bytes(cache.dumps(TABLES, format))
+
+        assert cache.read(str(path)) == TABLES
+
+    def test_compressed(self):
+        tables = dict(TABLES, lr_action=[{"VALUE": 2}] * 1000)
+        assert len(cache.dumps(tables, "compressed")) < len(cache.dumps(tables))
+
+    def test_unknown_format(self):
+        with raises(ValueError):
+            cache.dumps(TABLES, "xml")
+
+    def test_incompatible(self):
+        data = bytearray(cache.dumps(TABLES))
+        cache.HEADER.pack_into(
+            data, 0, cache.MAGIC, cache.FORMAT_VERSION, marshal.version + 1, 0
+        )
+        assert cache.loads(data) is None
+
+    def test_damaged(self, tmp_path):
+        path = tmp_path / "tables"
+        for data in [b"", cache.dumps(TABLES)[:-5], b'{"lr_action": [']:
+            path.write_bytes(data)
+            assert cache.read(str(path)) is None
+
+
+def make_generator(cache):
+    pg = ParserGenerator(["VALUE"], cache_id="test", cache=cache)
+    pg.production("main : VALUE", action=PASS(0))
+    return pg
+
+
+def no_build(monkeypatch):
+    def fail(*args):
+        raise AssertionError("the tables must come from the cache")
+
+    monkeypatch.setattr(LRTable, "from_grammar", fail)
+
+
+class TestBackends(object):
+    def test_directory(self, tmp_path, monkeypatch):
+        monkeypatch.setenv(cache.CACHE_DIR_ENV, str(tmp_path / "env"))
+        backend = cache.DirectoryCache(format="json")
+        assert backend.path == str(tmp_path / "env")
+
+        make_generator(backend).build()
+        [entry] = backend.entries()
+        assert entry.path.endswith(".json")
+
+        backend = cache.DirectoryCache(str(tmp_path / "arg"))
+        make_generator(backend).build()
+        [entry] = backend.entries()
+        assert entry.path.endswith(".tables")
+
+        no_build(monkeypatch)
+        parser = make_generator(cache.DirectoryCache(str(tmp_path / "arg"))).build()
+        assert parser.parse(iter([Token("VALUE", "1")])) == Token("VALUE", "1")
+
+    def test_memory(self, tmp_path, monkeypatch):
+        memory = cache.MemoryCache()
+        directory = cache.DirectoryCache(str(tmp_path))
+        make_generator(directory).build()
+
+        # Hits in later backends are stored in earlier ones.
+        make_generator([memory, directory]).build()
+        assert len(memory.tables) == 1
+
+        no_build(monkeypatch)
+        for path in tmp_path.iterdir():
+            path.unlink()
+        parser = make_generator([memory, directory]).build()
+        assert parser.parse(iter([Token("VALUE", "1")])) == Token("VALUE", "1")
+
+    def test_bundled(self, tmp_path, monkeypatch):
+        package = tmp_path / "bundled_tables"
+        package.mkdir()
+        (package / "__init__.py").write_text("")
+        make_generator(cache.DirectoryCache(str(package))).build()
+        monkeypatch.syspath_prepend(str(tmp_path))
+
+        no_build(monkeypatch)
+        parser = make_generator(cache.BundledCache("bundled_tables")).build()
+        assert parser.parse(iter([Token("VALUE", "1")])) == Token("VALUE", "1")
+
+
+def make_entry(directory, key, size, age):
+    path = directory / (key + ".tables")
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+
+
+class TestDirectoryCache(object):
+    def test_store_removes_stale(self, tmp_path):
+        make_entry(tmp_path, "test-1-old", 10, 100)
+        make_entry(tmp_path, "other-1-old", 10, 100)
+
+        make_generator(cache.DirectoryCache(str(tmp_path))).build()
+
+        entries = cache.DirectoryCache(str(tmp_path)).entries()
+        assert [entry.cache_id for entry in entries] == ["other", "test"]
+        assert entries[1].key.startswith("test-1-")
+
+    def test_store_keeps_variants(self, tmp_path):
+        make_entry(tmp_path, "test-1-old.slr", 10, 100)
+        backend = cache.DirectoryCache(str(tmp_path))
+        for method in ["lalr", "slr", "lalr"]:
+            make_generator(backend).build(method=method)
+        make_generator(backend).build(starts=["main"])
+
+        keys = sorted(entry.key for entry in backend.entries())
+        assert len(keys) == 2
+        assert keys[1] == keys[0] + ".slr"
+
+    def test_max_size(self, tmp_path, monkeypatch):
+        backend = cache.DirectoryCache(str(tmp_path), max_size=2**16)
+        make_entry(tmp_path, "a-1-a", 2**15, 300)
+        make_entry(tmp_path, "b-1-b", 2**15, 200)
+        make_entry(tmp_path, "c-1-c", 2**15, 100)
+        make_generator(backend).build()
+
+        assert [entry.cache_id for entry in backend.entries()] == ["c", "test"]
+
+    def test_prune(self, tmp_path):
+        make_entry(tmp_path, "a-1-old", 10, 400)
+        make_entry(tmp_path, "a-1-new", 10, 300)
+        make_entry(tmp_path, "b-1-b", 10, 200)
+        make_entry(tmp_path, "c-1-c", 10, 10)
+        (tmp_path / "unrelated.txt").write_text("")
+        backend = cache.DirectoryCache(str(tmp_path))
+
+        assert [e.key for e in backend.prune()] == ["a-1-old"]
+        assert [e.key for e in backend.prune(max_age=250)] == ["a-1-new"]
+        assert [e.key for e in backend.prune(max_size=15)] == ["b-1-b"]
+        assert [e.key for e in backend.clear()] == ["c-1-c"]
+        assert [p.name for p in tmp_path.iterdir()] == ["unrelated.txt"]
+
+
+def count_builds(monkeypatch, path):
+    from_grammar = LRTable.from_grammar
+
+    def counting(*args, **kwargs):
+        with open(path, "a") as f:
+            f.write("x")
+        time.sleep(0.2)
+        return from_grammar(*args, **kwargs)
+
+    monkeypatch.setattr(LRTable, "from_grammar", counting)
+
+
+@mark.skipif(cache.fcntl is None, reason="requires fcntl")
+class TestLocking(object):
+    def test_concurrent_builds(self, tmp_path, monkeypatch):
+        count_builds(monkeypatch, tmp_path / "builds")
+        directory = tmp_path / "cache"
+
+        def build():
+            make_generator(cache.DirectoryCache(str(directory))).build()
+
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=build) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        assert [process.exitcode for process in processes] == [0] * 4
+        assert (tmp_path / "builds").read_text() == "x"
+
+    def test_timeout(self, tmp_path, monkeypatch):
+        count_builds(monkeypatch, tmp_path / "builds")
+        backend = cache.DirectoryCache(str(tmp_path), lock_timeout=0.1)
+
+        with open(tmp_path / "test.lock", "a") as f:
+            cache.fcntl.flock(f, cache.fcntl.LOCK_EX)
+            make_generator(backend).build()
+
+        assert (tmp_path / "builds").read_text() == "x"
+
+    def test_cli(self, tmp_path, capsys):
+        make_entry(tmp_path, "a-1-old", 2048, 400)
+        make_entry(tmp_path, "a-1-new", 10, 300)
+
+        assert main(["cache", "list", "--dir", str(tmp_path)]) == 0
+        output = capsys.readouterr().out
+        assert "a-1-old" in output
+        assert "2 entries, 2.0K" in output
+
+        main(["cache", "prune", "--dir", str(tmp_path), "--max-size", "1K"])
+        assert "Removed 1 entries" in capsys.readouterr().out
+        assert [e.key for e in cache.DirectoryCache(str(tmp_path)).entries()] == [
+            "a-1-new"
+        ]
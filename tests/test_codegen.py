@@ -0,0 +1,229 @@
+import random
+import types
+
+from pytest import raises
+
+from rply import APPEND, LIST, PASS, TUPLE, ParserGenerator, ParsingError, Token
+from rply.codegen import generate_parser
+from rply.parser import GeneratedLRParser
+
+
+def tree(name):
+    def func(p):
+        return (name, [(x.name, x.value) if isinstance(x, Token) else x for x in p])
+
+    return func
+
+
+def arithmetic():
+    pg = ParserGenerator(
+        ["NUMBER", "PLUS", "MINUS", "TIMES", "LPAREN", "RPAREN"],
+        precedence=[
+            ("left", ["PLUS", "MINUS"]),
+            ("left", ["TIMES"]),
+            ("right", ["UMINUS"]),
+        ],
+    )
+    pg.production("main : expr")(tree("main"))
+    pg.production("expr : expr PLUS expr | expr MINUS expr")(tree("binop"))
+    pg.production("expr : expr TIMES expr")(tree("times"))
+    pg.production("expr : MINUS expr", precedence="UMINUS")(tree("neg"))
+    pg.production("expr : LPAREN expr RPAREN")(tree("group"))
+    pg.production("expr : NUMBER")(tree("number"))
+    return pg
+
+
+def statements():
+    pg = ParserGenerator(["NAME", "EQUALS", "SEMI", "LBRACE", "RBRACE", "COMMA"])
+    pg.production("program : stmts")(tree("program"))
+    pg.production("stmts : | stmts stmt")(tree("stmts"))
+    pg.production("stmt : NAME EQUALS value SEMI")(tree("assign"))
+    pg.production("stmt : LBRACE stmts RBRACE")(tree("block"))
+    pg.production("value : NAME | LBRACE names RBRACE")(tree("value"))
+    pg.production("names : | NAME | NAME COMMA names")(tree("names"))
+    return pg
+
+
+def with_actions():
+    pg = ParserGenerator(["NAME", "COMMA", "LPAREN", "RPAREN", "EMPTY"])
+    pg.production("main : expr", action=PASS(0))
+    pg.production("expr : LPAREN args RPAREN", action=PASS(1))
+    pg.production("expr : NAME", action=TUPLE)
+    pg.production("expr : EMPTY empty", action=LIST)
+    pg.production("empty :", action=TUPLE)
+    pg.production("args : expr", action=LIST)
+    pg.production("args : args COMMA expr", action=APPEND(0, 2))
+    return pg
+
+
+def generate_tokens(pg, rng, max_depth=6):
+    rules = {}
+    for name, syms, _, _ in pg.productions:
+        rules.setdefault(name, []).append(syms)
+
+    def expand(sym, depth):
+        if sym not in rules:
+            yield Token(sym, "%s%d" % (sym.lower(), rng.randrange(100)))
+            return
+        options = rules[sym]
+        if depth >= max_depth:
+            options = [min(options, key=lambda syms: sum(s in rules for s in syms))]
+        for s in rng.choice(options):
+            yield from expand(s, depth + 1)
+
+    return list(expand(pg.productions[0][0], 0))
+
+
+def mutate(tokens, rng, names):
+    tokens = list(tokens)
+    for _ in range(rng.randrange(1, 3)):
+        op = rng.randrange(3)
+        i = rng.randrange(len(tokens) + 1)
+        if op == 0 and tokens:
+            del tokens[min(i, len(tokens) - 1)]
+        elif op == 1:
+            tokens.insert(i, Token(rng.choice(names), "x"))
+        elif len(tokens) > 1:
+            j = rng.randrange(len(tokens))
+            tokens[min(i, len(tokens) - 1)], tokens[j] = (
+                tokens[j],
+                tokens[min(i, len(tokens) - 1)],
+            )
+    return tokens
+
+
+def load_generated(pg):
+    module = types.ModuleType("generated")
+    table = pg.build().lr_table
+    exec(generate_parser(table), module.__dict__)
+    return GeneratedLRParser(table, pg.error_handler, bind=module.bind)
+
+
+def outcome(parser, tokens):
+    try:
+        return "ok", parser.parse(iter(tokens))
+    except ParsingError as e:
+        return "error", e.source_position
+
+
+class TestDifferential(object):
+    def check(self, pg, count=300):
+        rng = random.Random(1234)
+        table_parser = pg.build()
+        generated = load_generated(pg)
+        names = sorted(pg.tokens)
+        for _ in range(count):
+            tokens = generate_tokens(pg, rng)
+            if rng.random() < 0.5:
+                tokens = mutate(tokens, rng, names)
+            assert outcome(generated, tokens) == outcome(table_parser, tokens)
+
+    def test_arithmetic(self):
+        self.check(arithmetic())
+
+    def test_statements(self):
+        self.check(statements())
+
+    def test_actions(self):
+        self.check(with_actions())
+
+    def test_error_recovery(self):
+        errors = []
+        pg = statements()
+        pg.production("stmt : error SEMI")(tree("error"))
+        pg.error(errors.append)
+
+        rng = random.Random(4321)
+        table_parser = pg.build()
+        generated = load_generated(pg)
+        for _ in range(300):
+            tokens = mutate(generate_tokens(pg, rng), rng, sorted(pg.tokens))
+            expected = outcome(table_parser, tokens), list(errors)
+            del errors[:]
+            assert (outcome(generated, tokens), list(errors)) == expected
+            del errors[:]
+
+
+class TestGeneratedParser(object):
+    def test_state(self):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(state, p):
+            state.append(p[0].value)
+            return p[0]
+
+        parser = load_generated(pg)
+        state = []
+        assert parser.parse(iter([Token("VALUE", "a")]), state=state) == Token(
+            "VALUE", "a"
+        )
+        assert state == ["a"]
+
+    def test_error_handler(self):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(p):
+            return p[0]
+
+        @pg.error
+        def error_handler(token):
+            raise ValueError(token)
+
+        parser = load_generated(pg)
+        token = Token("VALUE", "b")
+        with raises(ValueError) as exc_info:
+            parser.parse(iter([Token("VALUE", "a"), token]))
+        assert exc_info.value.args[0] is token
+
+    def test_generate_module(self, tmp_path, monkeypatch):
+        pg = arithmetic()
+        pg.generate_module(str(tmp_path / "codegen_parsetab.py"), code=True)
+        monkeypatch.syspath_prepend(str(tmp_path))
+
+        parser = arithmetic().load_module("codegen_parsetab")
+        assert isinstance(parser, GeneratedLRParser)
+        assert parser.parse(iter([Token("NUMBER", "1")])) == (
+            "main",
+            [("number", [("NUMBER", "1")])],
+        )
+
+    def test_starts(self):
+        table_parser = statements().build(starts=["program", "value"])
+        module = types.ModuleType("generated")
+        exec(generate_parser(table_parser.lr_table), module.__dict__)
+        generated = GeneratedLRParser(table_parser.lr_table, bind=module.bind)
+
+        def parse_value(parser, tokens):
+            try:
+                return "ok", parser.parse(iter(tokens), start="value")
+            except ParsingError as e:
+                return "error", e.source_position
+
+        for tokens in [
+            [Token("NAME", "a")],
+            [Token("LBRACE", "{"), Token("NAME", "a"), Token("RBRACE", "}")],
+            [Token("NAME", "a"), Token("SEMI", ";")],
+        ]:
+            assert parse_value(generated, tokens) == parse_value(table_parser, tokens)
+        assert parse_value(generated, [Token("NAME", "a")])[1] == (
+            "value",
+            [("NAME", "a")],
+        )
+
+    def test_generate_module_starts(self, tmp_path, monkeypatch):
+        monkeypatch.syspath_prepend(str(tmp_path))
+        for code in [False, True]:
+            name = "codegen_starts_%s_parsetab" % code
+            statements().generate_module(
+                str(tmp_path / ("%s.py" % name)), code=code, starts=["program", "value"]
+            )
+
+            parser = statements().load_module(name)
+            assert isinstance(parser, GeneratedLRParser) == code
+            assert parser.parse(iter([Token("NAME", "a")]), start="value") == (
+                "value",
+                [("NAME", "a")],
+            )
+            assert parser.parse(iter([])) == ("program", [("stmts", [])])
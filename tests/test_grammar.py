@@ -0,0 +1,104 @@
+import random
+
+from rply.grammar import Grammar
+
+
+def make_grammar(productions):
+    g = Grammar(["A", "B", "C"])
+    for rule in productions:
+        name, body = rule.split(":")
+        g.add_production(name.strip(), body.split(), None, None)
+    g.set_start()
+    g.build_lritems()
+    g.compute_first()
+    g.compute_follow()
+    return g
+
+
+def reference_follow(g):
+    # The fixed point iteration FOLLOW used to be computed with.
+    follow = {n: set() for n in g.nonterminals}
+    follow[g.start].add("$end")
+    added = True
+    while added:
+        added = False
+        for p in g.productions[1:]:
+            for i, B in enumerate(p.prod):
+                if B not in g.nonterminals:
+                    continue
+                first = set(g._first(p.prod[i + 1 :]))
+                new = first - {"<empty>"}
+                if "<empty>" in first:
+                    new |= follow[p.name]
+                if not new <= follow[B]:
+                    follow[B] |= new
+                    added = True
+    return {n: sorted(f) for n, f in follow.items()}
+
+
+class TestGrammar(object):
+    def test_first_and_follow(self):
+        g = make_grammar(
+            [
+                "main : items C",
+                "items : items item",
+                "items :",
+                "item : opt B",
+                "item : A",
+                "opt : C",
+                "opt :",
+            ]
+        )
+
+        assert g.first["main"] == ["A", "B", "C"]
+        assert g.first["items"] == ["<empty>", "A", "B", "C"]
+        assert g.first["item"] == ["A", "B", "C"]
+        assert g.first["opt"] == ["<empty>", "C"]
+        assert g.follow["main"] == ["$end"]
+        assert g.follow["items"] == ["A", "B", "C"]
+        assert g.follow["item"] == ["A", "B", "C"]
+        assert g.follow["opt"] == ["B"]
+
+    def test_follow_nullable_before_non_nullable(self):
+        g = make_grammar(["s : a A", "a : b c B", "c :", "c : C", "b : A"])
+
+        assert g.follow["b"] == ["B", "C"]
+        assert g.follow["c"] == ["B"]
+
+    def test_follow_matches_reference(self):
+        rand = random.Random(0)
+        names = ["s", "n1", "n2", "n3", "n4"]
+        for _ in range(300):
+            productions = ["s : n1"]
+            for name in names:
+                for _ in range(rand.randint(1, 3)):
+                    body = rand.choices(
+                        names[1:] + ["A", "B", "C"], k=rand.randint(0, 4)
+                    )
+                    productions.append("%s : %s" % (name, " ".join(body)))
+            g = make_grammar(productions)
+
+            assert g.follow == reference_follow(g)
+
+    def test_long_chain(self):
+        count = 2000
+        productions = []
+        for i in range(count):
+            productions += ["n%d : A n%d" % (i, i + 1), "n%d : C" % i]
+        g = make_grammar(productions + ["n%d : B" % count])
+
+        assert g.first["n0"] == ["A", "C"]
+        assert g.follow["n%d" % count] == ["$end"]
+
+    def test_lr_items(self):
+        g = make_grammar(["main : A item", "item : B C"])
+        p = g.productions[2]
+
+        assert [item.prod for item in p.lr_items] == [
+            [".", "B", "C"],
+            ["B", ".", "C"],
+            ["B", "C", "."],
+        ]
+        assert all(item.production is p for item in p.lr_items)
+        assert p.lr_next is p.lr_items[0]
+        assert not hasattr(p.lr_items[0], "__dict__")
@@ -2,8 +2,9 @@ import operator
 
 from pytest import raises
 
-from rply import ParserGenerator, ParsingError, Token
-from rply.errors import ParserGeneratorWarning
+from rply import APPEND, LIST, PASS, TUPLE, ParserGenerator, ParsingError, Token
+from rply.errors import ParserGeneratorError, ParserGeneratorWarning
+from rply.grammar import RuntimeGrammar
 from rply.token import SourcePosition
 
 from .base import BaseTests
@@ -314,3 +315,327 @@ class TestParser(BaseTests):
             "token:None",
             "main",
         ]
+
+    def make_statements(self):
+        pg = ParserGenerator(["NAME", "EQUALS", "SEMI"])
+
+        @pg.production("main : stmts")
+        def main(p):
+            return p[0]
+
+        @pg.production("stmts : stmts stmt")
+        def stmts_stmt(p):
+            return p[0] + [p[1]]
+
+        @pg.production("stmts : stmt")
+        def stmts(p):
+            return [p[0]]
+
+        @pg.production("stmt : NAME EQUALS NAME SEMI")
+        def stmt_assign(p):
+            return (p[0].value, p[2].value)
+
+        @pg.production("stmt : error SEMI")
+        def stmt_error(p):
+            return p[0]
+
+        return pg
+
+    def test_error_recovery(self):
+        pg = self.make_statements()
+        errors = []
+
+        @pg.error
+        def error_handler(token):
+            errors.append(token)
+
+        parser = pg.build()
+        result = parser.parse(
+            iter(
+                [
+                    Token("NAME", "a"),
+                    Token("EQUALS", "="),
+                    Token("NAME", "b"),
+                    Token("SEMI", ";"),
+                    Token("NAME", "c"),
+                    Token("EQUALS", "=", SourcePosition(6, 1, 7)),
+                    Token("EQUALS", "=", SourcePosition(8, 1, 9)),
+                    Token("NAME", "d"),
+                    Token("SEMI", ";"),
+                    Token("NAME", "x"),
+                    Token("EQUALS", "="),
+                    Token("NAME", "y"),
+                    Token("SEMI", ";"),
+                    Token("NAME", "e"),
+                    Token("NAME", "f", SourcePosition(14, 1, 15)),
+                    Token("SEMI", ";"),
+                    Token("NAME", "g"),
+                    Token("EQUALS", "="),
+                    Token("NAME", "h"),
+                    Token("SEMI", ";"),
+                ]
+            )
+        )
+
+        assert [e.position.index for e in errors] == [8, 14]
+        assert result[0] == ("a", "b")
+        assert result[1] == Token("error", "=")
+        assert result[2] == ("x", "y")
+        assert result[3] == Token("error", "f")
+        assert result[4] == ("g", "h")
+
+    def test_error_recovery_at_end(self):
+        pg = self.make_statements()
+        errors = []
+
+        @pg.error
+        def error_handler(token):
+            errors.append(token)
+
+        parser = pg.build()
+        with raises(ParsingError):
+            parser.parse(iter([Token("NAME", "a"), Token("EQUALS", "=")]))
+        assert errors == [Token("$end", "$end")]
+
+    def test_error_recovery_bare_error(self):
+        pg = ParserGenerator(["NAME", "SEMI"])
+        errors = []
+
+        @pg.production("stmts : stmts stmt")
+        def stmts_stmt(p):
+            return p[0] + [p[1]]
+
+        @pg.production("stmts : stmt")
+        def stmts(p):
+            return [p[0]]
+
+        @pg.production("stmt : NAME SEMI")
+        def stmt_name(p):
+            return p[0].value
+
+        @pg.production("stmt : error")
+        def stmt_error(p):
+            return p[0]
+
+        @pg.error
+        def error_handler(token):
+            errors.append(token)
+
+        parser = pg.build()
+        result = parser.parse(
+            iter(
+                [
+                    Token("NAME", "a"),
+                    Token("SEMI", ";"),
+                    Token("X", "x"),
+                    Token("NAME", "b"),
+                    Token("SEMI", ";"),
+                ]
+            )
+        )
+
+        assert errors == [Token("X", "x")]
+        assert result == ["a", Token("error", "x"), "b"]
+
+    def test_error_handler_returns_without_error_rules(self):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(p):
+            return p[0]
+
+        @pg.error
+        def error_handler(token):
+            pass
+
+        parser = pg.build()
+        assert not parser.lr_table.has_error_rules
+        with raises(ParsingError):
+            parser.parse(iter([Token("VALUE", "a"), Token("VALUE", "b")]))
+
+    def test_has_error_rules(self):
+        parser = self.make_statements().build()
+        assert parser.lr_table.has_error_rules
+        shm = parser.share()
+        try:
+            assert parser.lr_table.has_error_rules
+        finally:
+            shm.unlink()
+
+    def test_validate(self):
+        pg = ParserGenerator(["VALUE", "COMMA"])
+        calls = []
+
+        @pg.production("main : values")
+        def main(p):
+            calls.append("main")
+            return p[0]
+
+        @pg.production("values : values COMMA VALUE | VALUE")
+        def values(p):
+            calls.append("values")
+            return p
+
+        @pg.error
+        def error_handler(token):
+            calls.append("error")
+
+        parser = pg.build()
+
+        assert (
+            parser.validate(
+                iter([Token("VALUE", "a"), Token("COMMA", ","), Token("VALUE", "b")])
+            )
+            is None
+        )
+
+        error = parser.validate(
+            iter(
+                [
+                    Token("VALUE", "a"),
+                    Token("COMMA", ","),
+                    Token("COMMA", ",", SourcePosition(3, 1, 4)),
+                ]
+            )
+        )
+        assert isinstance(error, ParsingError)
+        assert error.getsourcepos().index == 3
+
+        error = parser.validate(iter([Token("VALUE", "a"), Token("COMMA", ",")]))
+        assert isinstance(error, ParsingError)
+        assert error.getsourcepos() is None
+
+        assert calls == []
+
+    def test_actions(self):
+        pg = ParserGenerator(["NAME", "COMMA", "LPAREN", "RPAREN"])
+
+        pg.production("main : LPAREN args RPAREN", action=PASS(1))
+        pg.production("args : arg", action=LIST)
+        pg.production("args : args COMMA arg", action=APPEND(0, 2))
+        pg.production("arg : NAME NAME", action=TUPLE)
+
+        @pg.production("arg : LPAREN RPAREN")
+        def arg_empty(state, p):
+            state.count += 1
+            return ()
+
+        parser = pg.build()
+        state = ParserState()
+        result = parser.parse(
+            iter(
+                [
+                    Token("LPAREN", "("),
+                    Token("NAME", "a"),
+                    Token("NAME", "b"),
+                    Token("COMMA", ","),
+                    Token("LPAREN", "("),
+                    Token("RPAREN", ")"),
+                    Token("COMMA", ","),
+                    Token("NAME", "c"),
+                    Token("NAME", "d"),
+                    Token("RPAREN", ")"),
+                ]
+            ),
+            state=state,
+        )
+        assert result == [
+            (Token("NAME", "a"), Token("NAME", "b")),
+            (),
+            (Token("NAME", "c"), Token("NAME", "d")),
+        ]
+        assert state.count == 1
+
+    def test_action_out_of_range(self):
+        pg = ParserGenerator(["VALUE"])
+        pg.production("main : VALUE", action=PASS(1))
+
+        with raises(ParserGeneratorError):
+            pg.build()
+
+    def test_eliminate_unit_productions(self):
+        pg = ParserGenerator(["NUMBER", "PLUS", "TIMES", "LPAREN", "RPAREN"])
+        pg.production("main : expr", action=PASS(0))
+        pg.production("expr : expr PLUS term", action=TUPLE)
+        pg.production("expr : term", action=PASS(0))
+        pg.production("term : term TIMES factor", action=TUPLE)
+        pg.production("term : factor", action=PASS(0))
+        pg.production("factor : atom", action=PASS(0))
+        pg.production("atom : LPAREN expr RPAREN", action=PASS(1))
+        pg.production("atom : NUMBER", action=PASS(0))
+
+        def tokens(*names):
+            return iter([Token(name, str(i)) for i, name in enumerate(names)])
+
+        parser = pg.build()
+        optimized = pg.build(eliminate_unit_productions=True)
+        inputs = [
+            ("NUMBER",),
+            ("NUMBER", "PLUS", "NUMBER", "TIMES", "LPAREN", "NUMBER", "RPAREN"),
+            ("LPAREN", "NUMBER", "PLUS", "NUMBER", "RPAREN", "TIMES", "NUMBER"),
+        ]
+        for names in inputs:
+            assert optimized.parse(tokens(*names)) == parser.parse(tokens(*names))
+
+        for names in [("NUMBER", "PLUS"), ("NUMBER", "NUMBER"), ("RPAREN",)]:
+            with raises(ParsingError) as expected:
+                parser.parse(tokens(*names))
+            with raises(ParsingError) as exc_info:
+                optimized.parse(tokens(*names))
+            assert exc_info.value.source_position == expected.value.source_position
+
+        tree = optimized.parse_tree(tokens("NUMBER"))
+        # term and factor are bypassed.
+        assert [node.name for node in tree.walk()] == ["main", "expr", "atom", "NUMBER"]
+
+    def test_strip(self):
+        pg = self.make_statements()
+        errors = []
+        pg.error(errors.append)
+
+        parser = pg.build(strip=True)
+        assert isinstance(parser.lr_table.grammar, RuntimeGrammar)
+        assert not hasattr(parser.lr_table.grammar, "first")
+
+        tokens = [
+            Token("NAME", "a"),
+            Token("EQUALS", "="),
+            Token("SEMI", ";"),
+            Token("NAME", "c"),
+            Token("EQUALS", "="),
+            Token("NAME", "d"),
+            Token("SEMI", ";"),
+        ]
+        assert parser.parse(iter(tokens)) == [Token("error", ";"), ("c", "d")]
+        assert len(errors) == 1
+        assert parser.parse_tree(iter(tokens)).root.name == "main"
+
+    def test_starts(self):
+        pg = self.make_statements()
+        errors = []
+        pg.error(errors.append)
+        parser = pg.build(starts=["main", "stmt"])
+
+        def tokens(text):
+            names = {"=": "EQUALS", ";": "SEMI"}
+            return iter([Token(names.get(word, "NAME"), word) for word in text.split()])
+
+        assert parser.parse(tokens("a = b ; c = d ;")) == [("a", "b"), ("c", "d")]
+        assert parser.parse(tokens("a = b ;"), start="main") == [("a", "b")]
+        assert parser.parse(tokens("a = b ;"), start="stmt") == ("a", "b")
+        assert parser.validate(tokens("a = b ;"), start="stmt") is None
+        assert parser.parse_tree(tokens("a = b ;"), start="stmt").root.name == "stmt"
+
+        assert parser.validate(tokens("a = b ; c = d ;"), start="stmt") is not None
+        assert errors == []
+        assert parser.parse(tokens("a = ;"), start="stmt") == Token("error", ";")
+        assert len(errors) == 1
+        with raises(ParsingError):
+            parser.parse(tokens("a = b"), start="stmt")
+
+        with raises(ValueError):
+            parser.parse(tokens("a = b ;"), start="stmts")
+
+    def test_undefined_start(self):
+        with raises(ParserGeneratorError):
+            self.make_statements().build(starts=["main", "expr"])
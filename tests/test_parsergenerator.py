@@ -1,9 +1,20 @@
+import os
+import signal
+import sys
+import threading
+import time
+import types
 import uuid
+import warnings
 
-from pytest import raises
+from pytest import mark, raises, warns
 
-from rply import ParserGenerator, Token
-from rply.errors import ParserGeneratorError
+from rply import PASS, TUPLE, ParserGenerator, ParsingError, Token
+from rply.__main__ import main
+from rply.errors import ParserGeneratorError, ParserGeneratorWarning
+from rply.grammar import Grammar
+from rply.parser import LazyLRParser
+from rply.parsergenerator import LRTable, digraph
 
 from .base import BaseTests
 
@@ -79,12 +90,54 @@ class TestParserGenerator(BaseTests):
 
         assert parser.parse(iter([Token("VALUE2", "3")])) == Token("VALUE2", "3")
 
+    def test_nullable_suffix(self):
+        pg = ParserGenerator(["NUMBER", "PLUS", "BANG"])
+        pg.production("main : main PLUS term opt", action=TUPLE)
+        pg.production("main : term opt", action=TUPLE)
+        pg.production("term : NUMBER", action=PASS(0))
+        pg.production("opt : BANG", action=PASS(0))
+        pg.production("opt :", action=TUPLE)
+        parser = pg.build()
+
+        def parse(*names):
+            return parser.parse(iter([Token(name, name) for name in names]))
+
+        assert parse("NUMBER") == (Token("NUMBER", "NUMBER"), ())
+        assert parse("NUMBER", "PLUS", "NUMBER", "BANG") == (
+            (Token("NUMBER", "NUMBER"), ()),
+            Token("PLUS", "PLUS"),
+            Token("NUMBER", "NUMBER"),
+            Token("BANG", "BANG"),
+        )
+
+    def test_rule_precedence_conflict(self):
+        pg = ParserGenerator(["NUMBER", "MINUS"], precedence=[("right", ["UMINUS"])])
+        pg.production("main : expr", action=PASS(0))
+        pg.production("expr : expr MINUS expr")(lambda p: int(p[0]) - int(p[2]))
+        pg.production("expr : MINUS expr", precedence="UMINUS")(lambda p: -int(p[1]))
+        pg.production("expr : NUMBER")(lambda p: int(p[0].value))
+
+        with self.assert_warns(ParserGeneratorWarning, "1 shift/reduce conflict"):
+            parser = pg.build()
+
+        def parse(text):
+            return parser.parse(
+                Token("MINUS", c) if c == "-" else Token("NUMBER", c) for c in text
+            )
+
+        assert parse("4-5") == -1
+        # The unary minus binds tighter than the binary one.
+        assert parse("-4-5") == -9
+
 
 class TestParserCaching(object):
-    def test_simple_caching(self):
+    @mark.parametrize("cache_format", ["binary", "compressed", "json"])
+    def test_simple_caching(self, cache_format):
         # Generate a random cache_id so that every test run does both the cache
         # write and read paths.
-        pg = ParserGenerator(["VALUE"], cache_id=str(uuid.uuid4()))
+        pg = ParserGenerator(
+            ["VALUE"], cache_id=str(uuid.uuid4()), cache_format=cache_format
+        )
 
         @pg.production("main : VALUE")
         def main(p):
@@ -94,3 +147,417 @@ class TestParserCaching(object):
         parser = pg.build()
 
         assert parser.parse(iter([Token("VALUE", "3")])) == Token("VALUE", "3")
+
+    def test_cache_hit_skips_analysis(self, monkeypatch):
+        cache_id = str(uuid.uuid4())
+
+        def make_generator(*rules):
+            tokens = sorted({rule.split()[-1] for rule in rules})
+            pg = ParserGenerator(tokens, cache_id=cache_id)
+            for rule in rules:
+                pg.production(rule, action=PASS(0))
+            return pg
+
+        make_generator("main : VALUE").build()
+
+        def fail(*args):
+            raise AssertionError("the grammar must not be analyzed")
+
+        with monkeypatch.context() as m:
+            m.setattr(Grammar, "build_lritems", fail)
+            m.setattr(Grammar, "compute_first", fail)
+            m.setattr(LRTable, "from_grammar", fail)
+            parser = make_generator("main : VALUE").build()
+        assert parser.parse(iter([Token("VALUE", "3")])) == Token("VALUE", "3")
+
+        # Changed declarations don't pick up the old tables.
+        parser = make_generator("main : VALUE", "main : COMMA").build()
+        assert parser.parse(iter([Token("COMMA", ",")])) == Token("COMMA", ",")
+
+    def test_deprecated_grammar_checks(self):
+        pg = ParserGenerator(["VALUE", "PLUS"], precedence=[("left", ["PLUS"])])
+        pg.production("main : main PLUS main | VALUE", action=PASS(0))
+        g = pg._make_grammar(None)
+
+        with warns(DeprecationWarning):
+            assert pg.compute_grammar_hash(g) == pg.compute_grammar_hash()
+
+        data = pg.serialize_table(pg.build().lr_table)
+        with warns(DeprecationWarning):
+            assert pg.data_is_valid(g, data)
+        data["productions"] = data["productions"][:-1]
+        with warns(DeprecationWarning):
+            assert not pg.data_is_valid(g, data)
+
+
+class TestLazyBuild(object):
+    def make_generator(self):
+        pg = ParserGenerator(["VALUE"])
+
+        @pg.production("main : VALUE")
+        def main(p):
+            return p[0]
+
+        return pg
+
+    def test_background(self):
+        parser = self.make_generator().build(lazy=True)
+        assert isinstance(parser, LazyLRParser)
+
+        assert parser.parse(iter([Token("VALUE", "3")])) == Token("VALUE", "3")
+        assert parser.built
+
+    def test_on_first_parse(self, monkeypatch):
+        builds = []
+        from_grammar = LRTable.from_grammar.__func__
+        monkeypatch.setattr(
+            LRTable,
+            "from_grammar",
+            classmethod(
+                lambda cls, g, **kwargs: builds.append(g)
+                or from_grammar(cls, g, **kwargs)
+            ),
+        )
+
+        parser = self.make_generator().build(lazy="parse")
+        assert not parser.built
+        assert builds == []
+
+        assert parser.validate(iter([Token("VALUE", "3")])) is None
+        assert parser.parse(iter([Token("VALUE", "3")])) == Token("VALUE", "3")
+        assert len(builds) == 1
+
+    def test_error_raised_on_use(self):
+        pg = ParserGenerator(["VALUE"])
+        pg.production("main : VALUE", precedence="MISSING")(lambda p: None)
+
+        parser = pg.build(lazy=True)
+        with raises(ParserGeneratorError):
+            parser.parse(iter([Token("VALUE", "3")]))
+
+    @mark.skipif(not hasattr(os, "fork"), reason="requires fork")
+    def test_fork_while_building(self, monkeypatch):
+        pg = self.make_generator()
+        parent = os.getpid()
+        started = threading.Event()
+        finish = threading.Event()
+        build_table = pg._build_table
+
+        def slow_build_table(*args):
+            if os.getpid() == parent:
+                started.set()
+                finish.wait()
+            return build_table(*args)
+
+        monkeypatch.setattr(pg, "_build_table", slow_build_table)
+        parser = pg.build(lazy=True)
+        assert started.wait(10)
+
+        with warnings.catch_warnings():
+            # Forking a process with threads is deprecated on Python 3.12.
+            warnings.simplefilter("ignore", DeprecationWarning)
+            pid = os.fork()
+        if pid == 0:
+            try:
+                result = parser.parse(iter([Token("VALUE", "3")]))
+                os._exit(0 if result == Token("VALUE", "3") else 1)
+            finally:
+                os._exit(2)
+
+        finish.set()
+        deadline = time.monotonic() + 10
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                break
+            if time.monotonic() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                raise AssertionError("the child process is deadlocked")
+            time.sleep(0.01)
+        assert os.waitstatus_to_exitcode(status) == 0
+        assert parser.parse(iter([Token("VALUE", "3")])) == Token("VALUE", "3")
+
+
+class TestBuildReport(object):
+    def make_generator(self):
+        pg = ParserGenerator(["NUMBER", "PLUS"])
+        pg.production("main : expr", action=PASS(0))
+        pg.production("expr : expr PLUS expr", action=TUPLE)
+        pg.production("expr : NUMBER", action=PASS(0))
+        return pg
+
+    def test_report(self):
+        with warns(ParserGeneratorWarning):
+            parser = self.make_generator().build()
+        report = self.make_generator().build_report()
+
+        assert [phase.name for phase in report.phases] == [
+            "build_lritems",
+            "compute_first",
+            "compute_follow",
+            "lr0",
+            "lookaheads",
+            "actions",
+        ]
+        assert all(phase.peak_memory is not None for phase in report.phases)
+        assert report.productions == 3
+        assert report.states == len(parser.lr_table.lr_action)
+        assert report.items >= report.states
+        assert report.terminal_transitions == 4
+        assert report.nonterminal_transitions == 3
+        assert 0 < report.action_density <= 1
+        assert 0 < report.goto_density <= 1
+        assert report.sr_conflicts == len(parser.lr_table.sr_conflicts) == 1
+        assert report.rr_conflicts == 0
+
+    def test_untraced_memory(self):
+        report = self.make_generator().build_report(trace_memory=False)
+        assert all(phase.peak_memory is None for phase in report.phases)
+        assert report.time == sum(phase.time for phase in report.phases)
+
+    def test_cli(self, monkeypatch, capsys):
+        module = types.ModuleType("report_grammar")
+        module.pg = self.make_generator()
+        monkeypatch.setitem(sys.modules, "report_grammar", module)
+
+        assert main(["report", "report_grammar:pg", "--no-memory"]) == 0
+        out = capsys.readouterr().out
+        assert "lookaheads" in out
+        assert "shift/reduce conflicts  1" in out
+
+
+class TestSLR(object):
+    def test_slr_grammar(self, monkeypatch):
+        pg = ParserGenerator(["NUMBER", "PLUS"])
+        pg.production("main : expr", action=PASS(0))
+        pg.production("expr : expr PLUS NUMBER", action=TUPLE)
+        pg.production("expr : NUMBER", action=PASS(0))
+
+        def fail(*args):
+            raise AssertionError("the LALR lookaheads must not be computed")
+
+        monkeypatch.setattr(LRTable, "compute_lalr_lookaheads", fail)
+        parser = pg.build(method="slr")
+        assert parser.parse(
+            iter([Token("NUMBER", "1"), Token("PLUS", "+"), Token("NUMBER", "2")])
+        ) == (Token("NUMBER", "1"), Token("PLUS", "+"), Token("NUMBER", "2"))
+
+    def test_falls_back_to_lalr(self):
+        # The textbook grammar which is LALR(1) but not SLR(1).
+        pg = ParserGenerator(["EQ", "STAR", "ID"])
+        pg.production("main : lvalue EQ rvalue", action=TUPLE)
+        pg.production("main : rvalue", action=PASS(0))
+        pg.production("lvalue : STAR rvalue", action=TUPLE)
+        pg.production("lvalue : ID", action=PASS(0))
+        pg.production("rvalue : lvalue", action=PASS(0))
+
+        parser = pg.build(method="slr")
+        assert not parser.lr_table.sr_conflicts
+        assert parser.lr_table.lr_action == pg.build().lr_table.lr_action
+
+    def test_precedence_stays_slr(self, monkeypatch):
+        pg = ParserGenerator(
+            ["NUMBER", "PLUS", "TIMES"],
+            precedence=[("left", ["PLUS"]), ("left", ["TIMES"])],
+        )
+        pg.production("main : expr", action=PASS(0))
+        pg.production("expr : expr PLUS expr", action=TUPLE)
+        pg.production("expr : expr TIMES expr", action=TUPLE)
+        pg.production("expr : NUMBER")(lambda p: p[0].value)
+        lalr = pg.build()
+
+        def fail(*args):
+            raise AssertionError("the LALR lookaheads must not be computed")
+
+        monkeypatch.setattr(LRTable, "compute_lalr_lookaheads", fail)
+        parser = pg.build(method="slr")
+        assert not parser.lr_table.sr_conflicts
+
+        tokens = [
+            Token("NUMBER", "1"),
+            Token("PLUS", "+"),
+            Token("NUMBER", "2"),
+            Token("TIMES", "*"),
+            Token("NUMBER", "3"),
+            Token("PLUS", "+"),
+            Token("NUMBER", "4"),
+        ]
+        expected = (
+            ("1", Token("PLUS", "+"), ("2", Token("TIMES", "*"), "3")),
+            Token("PLUS", "+"),
+            "4",
+        )
+        assert parser.parse(iter(tokens)) == lalr.parse(iter(tokens)) == expected
+
+    def test_unresolved_conflict_falls_back_to_lalr(self):
+        pg = ParserGenerator(["NUMBER", "PLUS"])
+        pg.production("main : expr", action=PASS(0))
+        pg.production("expr : expr PLUS expr", action=TUPLE)
+        pg.production("expr : NUMBER", action=PASS(0))
+
+        with warns(ParserGeneratorWarning, match="1 shift/reduce conflict"):
+            parser = pg.build(method="slr")
+        with warns(ParserGeneratorWarning):
+            assert parser.lr_table.lr_action == pg.build().lr_table.lr_action
+
+    def test_cache_key(self):
+        pg = ParserGenerator(["VALUE"])
+        pg.production("main : VALUE", action=PASS(0))
+        assert pg.compute_grammar_hash("slr") != pg.compute_grammar_hash()
+
+    def test_unknown_method(self):
+        with raises(ValueError):
+            ParserGenerator(["VALUE"]).build(method="lr1")
+
+
+class TestDigraph(object):
+    def test_cycles(self):
+        # 0 -> 1 -> 2 -> 1, 3 -> 0
+        F = digraph([[1], [2], [1], [0]], [0b0001, 0b0010, 0b0100, 0b1000])
+        assert F == [0b0111, 0b0110, 0b0110, 0b1111]
+
+    def test_long_chain(self):
+        count = 200000
+        R = [[i + 1] for i in range(count)] + [[]]
+        FP = [0] * count + [1]
+        # Close the chain into a cycle halfway through.
+        R[count // 2].append(0)
+        FP[0] = 2
+
+        F = digraph(R, FP)
+        assert F[0] == F[count // 2] == 3
+        assert F[count // 2 + 1] == 1
+
+
+class TestGeneratedModule(object):
+    def make_generator(self):
+        pg = ParserGenerator(["VALUE", "COMMA"], precedence=[("left", ["COMMA"])])
+
+        @pg.production("main : values")
+        def main(p):
+            return p[0]
+
+        @pg.production("values : values COMMA VALUE")
+        def values_append(p):
+            return p[0] + [p[2].value]
+
+        @pg.production("values : VALUE")
+        def values_value(p):
+            return [p[0].value]
+
+        return pg
+
+    def test_generate_and_load(self, tmp_path, monkeypatch):
+        pg = self.make_generator()
+        pg.generate_module(str(tmp_path / "generated_parsetab.py"))
+        monkeypatch.syspath_prepend(str(tmp_path))
+
+        parser = self.make_generator().load_module("generated_parsetab")
+
+        assert parser.parse(
+            iter([Token("VALUE", "a"), Token("COMMA", ","), Token("VALUE", "b")])
+        ) == ["a", "b"]
+
+    def test_load_mismatch(self, tmp_path, monkeypatch):
+        pg = self.make_generator()
+        pg.generate_module(str(tmp_path / "mismatched_parsetab.py"))
+        monkeypatch.syspath_prepend(str(tmp_path))
+
+        other = self.make_generator()
+
+        @other.production("values :")
+        def values_empty(p):
+            return []
+
+        with raises(ParserGeneratorError):
+            other.load_module("mismatched_parsetab")
+
+    def test_cli(self, tmp_path, monkeypatch, capsys):
+        (tmp_path / "cli_grammar.py").write_text(
+            "from rply import PASS, ParserGenerator\n"
+            "pg = ParserGenerator(['VALUE'])\n"
+            "pg.production('main : VALUE', action=PASS(0))\n"
+        )
+        monkeypatch.syspath_prepend(str(tmp_path))
+        path = tmp_path / "cli_parsetab.py"
+
+        assert main(["build", "cli_grammar:pg=%s" % path, "--code", "--jobs", "2"]) == 0
+        assert "cli_grammar:pg" in capsys.readouterr().out
+
+        pg = ParserGenerator(["VALUE"])
+        pg.production("main : VALUE", action=PASS(0))
+        parser = pg.load_module("cli_parsetab")
+        assert parser.parse(iter([Token("VALUE", "3")])) == Token("VALUE", "3")
+
+        assert main(["build", "cli_grammar:missing", "--jobs", "1"]) == 1
+        assert "failed" in capsys.readouterr().out
+
+
+class TestMacros(object):
+    def parse(self, parser, *names):
+        return parser.parse(iter([Token(name, name.lower()) for name in names]))
+
+    def test_star(self):
+        pg = ParserGenerator(["VALUE"])
+        pg.production("main : VALUE*", action=PASS(0))
+        parser = pg.build()
+
+        assert self.parse(parser) == []
+        assert self.parse(parser, "VALUE", "VALUE") == [
+            Token("VALUE", "value"),
+            Token("VALUE", "value"),
+        ]
+
+    def test_plus_and_optional(self):
+        pg = ParserGenerator(["VALUE", "SIGN"])
+        pg.production("main : SIGN? VALUE+", action=TUPLE)
+        parser = pg.build()
+
+        assert self.parse(parser, "VALUE") == (None, [Token("VALUE", "value")])
+        assert self.parse(parser, "SIGN", "VALUE", "VALUE") == (
+            Token("SIGN", "sign"),
+            [Token("VALUE", "value"), Token("VALUE", "value")],
+        )
+        with raises(ParsingError):
+            self.parse(parser, "SIGN")
+
+    def test_sep_by(self):
+        pg = ParserGenerator(["VALUE", "COMMA", "SEMI"])
+
+        @pg.production("main : sep_by(group, SEMI)")
+        def main(p):
+            return p[0]
+
+        pg.production("group : sep_by1( VALUE , COMMA )", action=PASS(0))
+        parser = pg.build()
+
+        assert self.parse(parser) == []
+        result = self.parse(parser, "VALUE", "COMMA", "VALUE", "SEMI", "VALUE")
+        assert [len(group) for group in result] == [2, 1]
+        with raises(ParsingError):
+            self.parse(parser, "VALUE", "COMMA")
+
+    def test_shared_helpers(self):
+        pg = ParserGenerator(["VALUE", "COMMA"])
+        pg.production("main : VALUE* COMMA VALUE*", action=TUPLE)
+
+        assert [name for name, _, _, _ in pg.productions] == [
+            "main",
+            "VALUE*",
+            "VALUE*",
+        ]
+
+    def test_malformed_sep_by(self):
+        pg = ParserGenerator(["VALUE"])
+        with raises(ParserGeneratorError):
+            pg.production("main : sep_by(VALUE)")
+
+    def test_long_list(self):
+        pg = ParserGenerator(["VALUE", "COMMA"])
+        pg.production("main : sep_by(VALUE, COMMA)", action=PASS(0))
+        parser = pg.build()
+
+        tokens = [Token("VALUE", "v"), Token("COMMA", ",")] * 100000
+        result = parser.parse(iter(tokens + [Token("VALUE", "v")]))
+        assert len(result) == 100001
@@ -0,0 +1,110 @@
+from pytest import raises
+
+from rply import ParserGenerator, ParsingError, Token
+from rply.errors import ParserGeneratorError
+from rply.sharedtable import SharedLRTable, pack_table, write_table
+
+from .utils import BoxInt
+
+
+def make_generator():
+    pg = ParserGenerator(
+        ["NUMBER", "PLUS", "TIMES"],
+        precedence=[
+            ("left", ["PLUS"]),
+            ("left", ["TIMES"]),
+        ],
+    )
+
+    @pg.production("main : expr")
+    def main(p):
+        return p[0]
+
+    @pg.production("expr : expr PLUS expr")
+    @pg.production("expr : expr TIMES expr")
+    def expr_binop(p):
+        if p[1].name == "PLUS":
+            return BoxInt(p[0].getint() + p[2].getint())
+        return BoxInt(p[0].getint() * p[2].getint())
+
+    @pg.production("expr : NUMBER")
+    def expr_num(p):
+        return BoxInt(int(p[0].value))
+
+    return pg
+
+
+def tokens():
+    return iter(
+        [
+            Token("NUMBER", "3"),
+            Token("TIMES", "*"),
+            Token("NUMBER", "4"),
+            Token("PLUS", "+"),
+            Token("NUMBER", "5"),
+        ]
+    )
+
+
+class TestSharedTable(object):
+    def test_pack_roundtrip(self):
+        parser = make_generator().build()
+        table = parser.lr_table
+        funcs = [p.func for p in table.grammar.productions]
+        shared = SharedLRTable(pack_table(table), funcs)
+
+        assert len(shared.lr_action) == len(table.lr_action)
+        for state in range(len(table.lr_action)):
+            assert dict(shared.lr_action[state]) == table.lr_action[state]
+            assert dict(shared.lr_goto[state]) == table.lr_goto[state]
+        assert list(shared.default_reductions) == table.default_reductions
+        assert "NUMBER" not in shared.lr_action[len(table.lr_action) - 1]
+
+    def test_share(self):
+        parser = make_generator().build()
+        shm = parser.share()
+        try:
+            assert isinstance(parser.lr_table, SharedLRTable)
+            assert parser.parse(tokens()) == BoxInt(17)
+            with raises(ParsingError):
+                parser.parse(iter([Token("PLUS", "+")]))
+
+            attached = make_generator().attach_table(name=shm.name)
+            assert attached.parse(tokens()) == BoxInt(17)
+        finally:
+            shm.unlink()
+
+    def test_share_starts(self):
+        parser = make_generator().build(starts=["main", "expr"])
+        shm = parser.share()
+        try:
+            attached = make_generator().attach_table(name=shm.name)
+            assert attached.parse(tokens()) == BoxInt(17)
+            assert attached.parse(tokens(), start="expr") == BoxInt(17)
+            assert parser.parse(tokens(), start="expr") == BoxInt(17)
+        finally:
+            shm.unlink()
+
+    def test_map_file(self, tmp_path):
+        path = str(tmp_path / "table.bin")
+        write_table(make_generator().build().lr_table, path)
+
+        parser = make_generator().attach_table(path=path)
+        assert parser.parse(tokens()) == BoxInt(17)
+
+    def test_grammar_mismatch(self, tmp_path):
+        path = str(tmp_path / "table.bin")
+        write_table(make_generator().build().lr_table, path)
+
+        pg = ParserGenerator(["NUMBER"])
+
+        @pg.production("main : NUMBER")
+        def main(p):
+            return p[0]
+
+        with raises(ParserGeneratorError):
+            pg.attach_table(path=path)
+
+    def test_name_or_path(self):
+        with raises(ValueError):
+            make_generator().attach_table()